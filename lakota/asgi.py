@@ -0,0 +1,332 @@
+"""
+The asgi sub-module implement an [ASGI](https://asgi.readthedocs.io)
+application that expose the same actions as `lakota.server` (so it can
+be used with `lakota.http_pod.HttpPOD`), without the need of flask. It
+is meant to be used with an ASGI server like uvicorn:
+
+``` shell
+$ lakota serve --asgi --workers 4
+INFO:     Started parent process [12345]
+...
+```
+
+Compared to the flask server:
+
+- Segments are streamed by chunks (each chunk is a ranged read on the
+  repository pod), range requests are supported.
+- Blocking calls on the repository are made in a thread pool so
+  concurrent clients are served in parallel, `--workers` allows to
+  start several processes.
+- Segments are served with an etag and as immutable, other files
+  with an etag based on their content, so clients can make
+  conditional requests. Listings are compressed with zstd when the
+  client accepts it.
+- Request latencies are exposed as histograms per action (in the
+  Prometheus text format) on `/metrics`.
+"""
+
+import asyncio
+import os
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from time import perf_counter
+from urllib.parse import parse_qs, urlsplit
+
+import msgpack
+from numcodecs import registry
+
+from .http_repo import run_query
+from .repo import Repo
+from .utils import content_etag, hexdigest
+
+__all__ = ["App", "create_app", "run"]
+
+chunk_size = 64 * 1024
+actions = (
+    "ls",
+    "read",
+    "read_many",
+    "rm",
+    "write",
+    "write_many",
+    "walk",
+    "query",
+    "len",
+    "metrics",
+)
+range_re = re.compile(r"bytes=(\d*)-(\d*)$")
+immutable = b"public, max-age=31536000, immutable"
+
+
+class Histogram:
+    """
+    Cumulative latency histogram per label
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float("inf"))
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = defaultdict(lambda: [0] * len(self.buckets))
+        self.sums = defaultdict(float)
+        self.lock = Lock()
+
+    def observe(self, label, value):
+        with self.lock:
+            self.counts[label][bisect_left(self.buckets, value)] += 1
+            self.sums[label] += value
+
+    def render(self):
+        lines = [f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label, counts in sorted(self.counts.items()):
+                total = 0
+                for bound, count in zip(self.buckets, counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(
+                        f'{self.name}_bucket{{action="{label}",le="{le}"}} {total}'
+                    )
+                lines.append(f'{self.name}_sum{{action="{label}"}} {self.sums[label]}')
+                lines.append(f'{self.name}_count{{action="{label}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=""):
+        self.status = status
+        self.message = message
+
+
+class App:
+    def __init__(self, repo, prefix=""):
+        self.repo = repo
+        self.prefix = prefix.rstrip("/")
+        self.latency = Histogram("lakota_request_duration_seconds")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        elif scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        action = None
+        if path.startswith(self.prefix):
+            action = path[len(self.prefix) :].strip("/")
+        start = perf_counter()
+        try:
+            if action is None:
+                raise HTTPError(404, "Not found")
+            await self.dispatch(action, scope, receive, send)
+        except HTTPError as exc:
+            await self.respond(send, exc.status, exc.message.encode())
+        finally:
+            # Keep the number of labels bounded
+            label = action if action in actions else "unknown"
+            self.latency.observe(label, perf_counter() - start)
+
+    async def dispatch(self, action, scope, receive, send):
+        params = {k: v[0] for k, v in parse_qs(scope["query_string"].decode()).items()}
+        headers = dict(scope["headers"])
+        relpath = params.get("path")
+        pod = self.repo.pod
+        run = asyncio.to_thread
+
+        if action == "ls":
+            relpath = "." if relpath is None else relpath
+            start_after = params.get("start_after")
+            try:
+                names = await run(pod.ls, relpath, start_after=start_after)
+            except FileNotFoundError:
+                raise HTTPError(404, f"{relpath} not found")
+            await self.respond_text(send, headers, "\n".join(names))
+
+        elif action == "read":
+            etag = content_etag(relpath)
+            if_none_match = headers.get(b"if-none-match", b"").decode()
+            if etag:
+                extra = [(b"etag", etag.encode()), (b"cache-control", immutable)]
+                if etag == if_none_match and await run(pod.isfile, relpath):
+                    return await self.respond(send, 304, b"", headers=extra)
+            if etag:
+                # Segments are read chunk by chunk
+                try:
+                    size = await run(pod.size, relpath)
+                except FileNotFoundError:
+                    raise HTTPError(404, f"{relpath} not found")
+
+                async def read(offset, length):
+                    return await run(pod.read_range, relpath, offset, length)
+
+            else:
+                try:
+                    data = await run(pod.read, relpath)
+                except FileNotFoundError:
+                    raise HTTPError(404, f"{relpath} not found")
+                # Other files can change, clients have to revalidate them
+                etag = f'"{hexdigest(data)}"'
+                extra = [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+                if etag == if_none_match:
+                    return await self.respond(send, 304, b"", headers=extra)
+                size = len(data)
+
+                async def read(offset, length):
+                    return data[offset : offset + length]
+
+            await self.stream(send, size, read, headers.get(b"range"), extra)
+
+        elif action == "read_many":
+            relpaths = msgpack.unpackb(await self.body(receive))
+            try:
+                payloads = await run(pod.read_many, relpaths)
+            except FileNotFoundError:
+                raise HTTPError(404)
+            payload = msgpack.packb([bytes(p) for p in payloads])
+            await self.respond(send, 200, payload, "application/msgpack")
+
+        elif action == "rm":
+            recursive = params.get("recursive", "").lower() == "true"
+            missing_ok = params.get("missing_ok", "").lower() == "true"
+            await run(pod.rm, relpath, recursive=recursive, missing_ok=missing_ok)
+            await self.respond(send, 200, b"ok")
+
+        elif action == "write":
+            data = await self.body(receive)
+            info = await run(pod.write, relpath, data)
+            await self.respond(send, 200, str(info or "").encode())
+
+        elif action == "write_many":
+            items = msgpack.unpackb(await self.body(receive))
+            info = await run(pod.write_many, items)
+            await self.respond(send, 200, msgpack.packb(info), "application/msgpack")
+
+        elif action == "walk":
+            if relpath:
+                pod = pod.cd(relpath)
+            max_depth = params.get("max_depth")
+            if max_depth is not None:
+                max_depth = int(max_depth)
+            names = await run(pod.walk, max_depth=max_depth)
+            await self.respond_text(send, headers, "\n".join(names))
+
+        elif action in ("query", "len"):
+            params = msgpack.unpackb(await self.body(receive))
+            try:
+                payload = await run(run_query, self.repo, params, action)
+            except FileNotFoundError as exc:
+                raise HTTPError(404, str(exc))
+            except ValueError as exc:
+                raise HTTPError(400, str(exc))
+            await self.respond(send, 200, payload, "application/msgpack")
+
+        elif action == "metrics":
+            await self.respond(send, 200, self.latency.render().encode())
+
+        else:
+            raise HTTPError(404, f"Action {action} not supported")
+
+    async def body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def respond(self, send, status, payload, mimetype="text/plain", headers=None):
+        headers = [
+            (b"content-type", mimetype.encode()),
+            (b"content-length", str(len(payload)).encode()),
+            *(headers or []),
+        ]
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        await send({"type": "http.response.body", "body": payload})
+
+    async def respond_text(self, send, req_headers, text):
+        # Compress (non-empty) listings if the client supports it
+        if text and b"zstd" in req_headers.get(b"accept-encoding", b""):
+            zstd = registry.codec_registry["zstd"]()
+            payload = zstd.encode(text.encode())
+            headers = [(b"content-encoding", b"zstd")]
+            return await self.respond(send, 200, payload, headers=headers)
+        await self.respond(send, 200, text.encode())
+
+    async def stream(self, send, size, read, range_header=None, extra_headers=None):
+        """
+        Send `size` bytes by chunks, `read(offset, length)` is awaited
+        for each of them
+        """
+        start, stop, status = 0, size, 200
+        headers = [
+            (b"content-type", b"application/octet-stream"),
+            (b"accept-ranges", b"bytes"),
+            *(extra_headers or []),
+        ]
+        if range_header is not None:
+            match = range_re.match(range_header.decode())
+            if not match or match.groups() == ("", ""):
+                raise HTTPError(416, "Unsupported range")
+            first, last = match.groups()
+            if not first:
+                # Suffix range: last n bytes
+                start = max(size - int(last), 0)
+            else:
+                start = int(first)
+                stop = min(int(last) + 1, size) if last else size
+            if start >= size or start >= stop:
+                raise HTTPError(416, "Range not satisfiable")
+            status = 206
+            headers.append(
+                (b"content-range", f"bytes {start}-{stop - 1}/{size}".encode())
+            )
+
+        headers.append((b"content-length", str(stop - start).encode()))
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers}
+        )
+        for pos in range(start, stop, chunk_size):
+            chunk = bytes(await read(pos, min(chunk_size, stop - pos)))
+            more = pos + chunk_size < stop
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+        if start == stop:
+            await send({"type": "http.response.body", "body": b""})
+
+
+def create_app():
+    """
+    Application factory, used by uvicorn workers (the repository and
+    url prefix are passed through environment variables)
+    """
+    repo = Repo(os.environ["LAKOTA_SERVE_REPO"])
+    return App(repo, prefix=os.environ.get("LAKOTA_SERVE_PREFIX", ""))
+
+
+def run(repo_uri, web_uri=None, workers=1, debug=False):
+    import uvicorn
+
+    parts = urlsplit(web_uri)
+    if not parts.scheme == "http":
+        msg = "Incorrect web uri, it should start with 'http://'"
+        raise ValueError(msg)
+
+    os.environ["LAKOTA_SERVE_REPO"] = repo_uri
+    os.environ["LAKOTA_SERVE_PREFIX"] = parts.path
+    uvicorn.run(
+        "lakota.asgi:create_app",
+        factory=True,
+        host=parts.hostname,
+        port=parts.port,
+        workers=workers,
+        log_level="debug" if debug else "info",
+    )
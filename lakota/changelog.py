@@ -4,24 +4,50 @@ from random import random
 from time import sleep
 
 from .commit import Commit
-from .utils import hexdigest, hexhash_len, hextime, tail
+from .utils import LRU, hexdigest, hexhash_len, hextime, settings, tail
 
 zero_hextime = "0" * 11
 zero_hash = "0" * hexhash_len
 phi = f"{zero_hextime}-{zero_hash}"
 
+# Decoded commits (and the size of their payload), shared by all
+# changelogs. Revision files are immutable and their names contain
+# the digest of their content, so the revision path (and the schema
+# used to decode it) is enough to identify a commit.
+commit_cache = LRU(
+    settings.commit_cache_size,
+    max_bytes=settings.commit_cache_bytes,
+    weigh=lambda item: item[1],
+)
+
 __all__ = ["Changelog", "Revision"]
 
 
 class Changelog:
 
     """
-    Build a tree over a pod to provide concurrent revisions
+    Build a tree over a pod to provide concurrent revisions.
+
+    The tree is kept in memory and `refresh` only lists revision files
+    whose parent is at most `window` milliseconds older than the most
+    recent parent already known (revisions are named
+    `<parent>.<child>` and both start with a hextime, so this is a
+    `StartAfter` listing on S3). This catches regular commits and
+    concurrent writers, branches created on an older parent by other
+    processes (like `squash` or `root=True` writes) are only picked up
+    by `refresh(full=True)`.
     """
 
+    window = 60_000
+
     def __init__(self, pod):
         self.pod = pod
         self._log_cache = None
+        self._stale = True
+        self._revisions = None  # Parent -> children relations
+        self._children = set()
+        self._names = set()
+        self._marker = None
 
     def commit(self, payload, parents=None, _jitter=False):
         assert isinstance(payload, bytes)
@@ -38,8 +64,13 @@ class Changelog:
         if _jitter:
             sleep(random())
 
-        # Compute new key
+        # Compute new key, all the revisions share the same child
         key = hexdigest(payload)
+        child = hextime() + "-" + key
+
+        # Make sure all the data is written before publishing the
+        # revisions
+        self.pod.flush()
 
         # Create one commit per parent
         revs = []
@@ -51,16 +82,25 @@ class Changelog:
                     continue
 
             # Construct new filename and save content
-            child = hextime() + "-" + key
             revision = Revision(self, parent, child)
             self.pod.write(revision.path, payload)
             revs.append(revision)
 
+        if self._revisions is not None:
+            self._extend(r.path for r in revs)
         self.refresh()
         return revs
 
-    def refresh(self):
+    def refresh(self, full=False):
+        """
+        Mark the in-memory tree as stale, new revisions will be listed
+        on next access. If `full` is true the tree is rebuilt from
+        scratch (needed to see removed revisions)
+        """
         self._log_cache = None
+        self._stale = True
+        if full:
+            self._revisions = None
 
     def __iter__(self):
         yield from self.pod.ls(missing_ok=True)
@@ -78,28 +118,54 @@ class Changelog:
         """
         Create a list of all the active revisions
         """
+        self._fetch()
         if before is not None:
             return self._log(before)
         if self._log_cache is None:
             self._log_cache = list(self._log())
         return self._log_cache
 
-    def _log(self, before=None):
-        # Extract parent->children relations
-        revisions = defaultdict(list)
-        all_children = set()
-        for name in sorted(self):
+    def _fetch(self):
+        if not self._stale:
+            return
+        if self._revisions is None:
+            self._revisions = defaultdict(list)
+            self._children = set()
+            self._names = set()
+            self._marker = None
+            names = self.pod.ls(missing_ok=True)
+        else:
+            names = self.pod.ls(missing_ok=True, start_after=self._marker)
+        self._extend(names)
+        self._stale = False
+
+    def _extend(self, names):
+        # Extract parent->children relations of new names
+        touched = set()
+        for name in sorted(n for n in names if n not in self._names):
+            self._names.add(name)
             parent, child = name.split(".")
             if parent == child:
                 continue
-            all_children.add(child)
-            revisions[parent].append(Revision(self, parent, child))
-
-        # `revision` is sorted low to high (because filled based on
-        # `sorted(self)`, so `queue` is sorted too (high to low). So
-        # the last revision to be yield is the last child of the
-        # oldest branch (aka oldest parent)
-        parent_revs = [r for r in revisions if r not in all_children]
+            self._children.add(child)
+            self._revisions[parent].append(Revision(self, parent, child))
+            touched.add(parent)
+
+        # Keep children sorted low to high
+        for parent in touched:
+            self._revisions[parent].sort(key=lambda r: r.child)
+
+        if self._revisions:
+            epoch = max(int(p.split("-", 1)[0], 16) for p in self._revisions)
+            self._marker = f"{max(epoch - self.window, 0):011x}"
+
+    def _log(self, before=None):
+        revisions = self._revisions
+        # Each list in `revisions` is sorted low to high, so `queue`
+        # is sorted too (high to low). So the last revision to be
+        # yield is the last child of the oldest branch (aka oldest
+        # parent)
+        parent_revs = sorted(r for r in revisions if r not in self._children)
         first_gen = list(chain.from_iterable(revisions[p] for p in parent_revs))
         queue = list(reversed(first_gen))
 
@@ -108,7 +174,7 @@ class Changelog:
         while queue:
             rev = queue.pop()
             # Append children
-            children = revisions[rev.child]
+            children = revisions.get(rev.child, [])
             rev.is_leaf = not children
             queue.extend(reversed(children))
 
@@ -127,7 +193,7 @@ class Changelog:
             new_paths.append(remote_path)
             payload = remote.pod.read(remote_path)
             self.pod.write(remote_path, payload)
-        self.refresh()
+        self.refresh(full=True)
         return new_paths
 
 
@@ -179,5 +245,16 @@ class Revision:
         """
         Instanciate commit based on self payload and series schema
         """
+        schema = collection.schema
+        bounds = (settings.commit_cache_size, settings.commit_cache_bytes)
+        if (commit_cache.size, commit_cache.max_bytes) != bounds:
+            # Settings were changed
+            commit_cache.resize(*bounds)
+        key = (self.path, str(schema.dump()))
+        item = commit_cache.get(key)
+        if item is not None:
+            return item[0]
         payload = self.read()
-        return Commit.decode(collection.schema, payload)
+        ci = Commit.decode(schema, payload)
+        commit_cache.set(key, (ci, len(payload)))
+        return ci
@@ -243,11 +243,14 @@ import os
 import sys
 from datetime import datetime
 from io import BytesIO, StringIO
-from itertools import chain
+from itertools import chain, islice
 
+from numpy import asarray
 from tabulate import tabulate
 
 from . import __version__
+from .frame import Frame
+from .http_repo import HttpRepo
 from .pod import POD
 from .repo import Repo
 from .schema import Schema
@@ -255,6 +258,9 @@ from .utils import hextime, logger, strpt, timeit
 
 
 def get_repo(args):
+    if args.repo and args.repo.startswith("http://"):
+        # Let the server run the queries
+        return HttpRepo(args.repo)
     return Repo(args.repo)
 
 
@@ -269,12 +275,12 @@ def get_collection(repo, label):
     exit(f'Collection "{label}" not found')
 
 
-def get_series(repo, label):
+def get_series(repo, label, create=False):
     if not "/" in label:
         exit(f'Label argument should have the form "collection/series"')
     c_label, s_label = label.split("/", 1)
     collection = get_collection(repo, c_label)
-    if label in collection:
+    if create or s_label in collection:
         return collection / s_label
     match = [s for s in collection if s.startswith(s_label)]
     if len(match) == 1:
@@ -323,14 +329,19 @@ def read(args):
         "offset": args.offset,
         "before": before,
     }
+    mask = args.mask
+    if mask and not reduce:
+        # Let the query filter rows (and skip segments)
+        query = query @ {"mask": mask}
+        mask = None
+    if reduce:
+        query = query @ {"reduce": {c: c for c in args.columns}}
     if args.paginate:
         frames = query.paginate(args.paginate)
     else:
-        frames = [query.frame()]
+        frames = iter([query.frame()])
 
     if reduce:
-        kw = {c: c for c in args.columns}
-        frames = (f.reduce(**kw) for f in frames)
         # Peek at first frame to get the colums
         first = next(frames)
         columns = list(first)
@@ -338,8 +349,8 @@ def read(args):
 
     if args.pretty:
         for frm in frames:
-            if args.mask:
-                frm = frm.mask(args.mask)
+            if mask:
+                frm = frm.mask(mask)
                 if frm.empty:
                     continue
             rows = zip(*(frm[col] for col in columns))
@@ -351,8 +362,8 @@ def read(args):
         writer = csv.writer(sys.stdout)
         writer.writerow(columns)
         for frm in frames:
-            if args.mask:
-                frm = frm.mask(args.mask)
+            if mask:
+                frm = frm.mask(mask)
                 if frm.empty:
                     continue
             rows = zip(*(frm[col] for col in columns))
@@ -360,6 +371,14 @@ def read(args):
 
 
 def export(args):
+    """
+    Export collections in the given uri, one file per series. The
+    format can be `csv` (the default), `arrow` (ipc file format) or
+    `parquet` (both needs the pyarrow module):
+    ```
+    $ lakota export file:///tmp/dump --format parquet
+    ```
+    """
     repo = get_repo(args)
     export_pod = POD.from_uri(args.uri)
     names = args.collection or repo.ls()
@@ -369,27 +388,49 @@ def export(args):
             logger.warn('Collection "%s" not found', clc_name)
         pod = export_pod.cd(clc_name)
         logger.info('Export collection "%s"', clc_name)
-        export_collection(pod, clc)
+        export_collection(pod, clc, fmt=args.format)
 
 
-def export_collection(pod, collection):
+def export_collection(pod, collection, fmt="csv", step=500_000):
+    if fmt != "csv":
+        pa = import_pyarrow()
     for srs_name in collection.ls():
-        # Read series
         srs = collection / srs_name
-        frm = srs.frame()
-        columns = list(frm)
-        # Save series as csv in buff
-        buff = StringIO()
-        writer = csv.writer(buff)
-        writer.writerow(columns)
-        rows = zip(*(frm[c] for c in columns))
-        writer.writerows(rows)
+        columns = list(collection.schema.columns)
+        if fmt == "csv":
+            # Save series as csv in buff
+            buff = StringIO()
+            writer = csv.writer(buff)
+            writer.writerow(columns)
+            for frm in srs.paginate(step):
+                rows = zip(*(frm[c] for c in columns))
+                writer.writerows(rows)
+            data = buff.getvalue().encode()
+        else:
+            # Stream pages in arrow record batches
+            buff = BytesIO()
+            writer = None
+            for batch in srs[columns].record_batches(step):
+                if writer is None:
+                    writer = arrow_writer(pa, fmt, buff, batch.schema)
+                writer.write_batch(batch)
+            if writer is None:
+                # Empty series
+                continue
+            writer.close()
+            data = buff.getvalue()
         # Write generated content in pod
-        buff.seek(0)
-        pod.write(f"{srs_name}.csv", buff.read().encode())
+        pod.write(f"{srs_name}.{fmt}", data)
 
 
 def import_(args):
+    """
+    Import collections created with `export`, the format is deduced
+    from the file extensions:
+    ```
+    $ lakota import file:///tmp/dump
+    ```
+    """
     repo = get_repo(args)
     import_pod = POD.from_uri(args.uri)
     names = args.collection or import_pod.ls()
@@ -403,20 +444,60 @@ def import_(args):
         import_collection(pod, clc)
 
 
-def import_collection(pod, collection):
-    column_names = sorted(collection.schema)
-    for file_name in pod.ls():
-        # Read file
-        stem, ext = file_name.rsplit(".", 1)
-        assert ext == "csv"
-        buff = StringIO(pod.read(file_name).decode())
-        reader = csv.reader(buff)
-        headers = next(reader)
-        assert sorted(headers) == column_names
-        columns = zip(*reader)
-        frm = dict(zip(headers, columns))
-        srs = collection / stem
-        srs.write(frm)
+def import_collection(pod, collection, step=500_000):
+    schema = collection.schema
+    column_names = sorted(schema)
+    with collection.batch() as batch:
+        for file_name in pod.ls():
+            # Read file
+            stem, ext = file_name.rsplit(".", 1)
+            srs = collection / stem
+            if ext == "csv":
+                buff = StringIO(pod.read(file_name).decode())
+                headers = next(csv.reader(buff))
+                assert sorted(headers) == column_names
+                frames = read_csv(schema, buff, step, columns=headers)
+            elif ext in ("arrow", "parquet"):
+                frames = read_arrow(schema, pod.read(file_name), ext)
+            else:
+                raise ValueError(f"Unsupported file format: {file_name}")
+            for frm in frames:
+                srs.write(frm, batch=batch)
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        exit("Please install pyarrow to use arrow or parquet format")
+    return pyarrow
+
+
+def arrow_writer(pa, fmt, sink, arrow_schema):
+    if fmt == "arrow":
+        return pa.ipc.new_file(sink, arrow_schema)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(sink, arrow_schema)
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def read_arrow(schema, data, fmt):
+    """
+    Yield one frame per record batch of the arrow or parquet content
+    `data`
+    """
+    pa = import_pyarrow()
+    if fmt == "arrow":
+        reader = pa.ipc.open_file(pa.BufferReader(data))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(pa.BufferReader(data)).iter_batches()
+    for batch in batches:
+        yield Frame.from_arrow(schema, batch)
 
 
 def length(args):
@@ -526,14 +607,52 @@ def write(args):
     ```
     $ cat some_file.csv | lakota write my_collection/my_series
     ```
+
+    Large files can be streamed by chunks of rows, each chunk is
+    written as a segment and all of them are committed together:
+    ```
+    $ cat big_file.csv | lakota write my_collection/my_series --chunk-size 1000000
+    ```
+
+    Use `--create` to write a new series:
+    ```
+    $ cat some_file.csv | lakota write my_collection/new_series --create
+    ```
     """
     repo = get_repo(args)
-    series = get_series(repo, args.label)
-    reader = csv.reader(sys.stdin)
-    columns = zip(*reader)
+    series = get_series(repo, args.label, create=args.create)
     schema = series.schema
-    df = dict(zip(schema.columns, columns))
-    series.write(df)
+    if not args.chunk_size:
+        reader = csv.reader(sys.stdin)
+        columns = zip(*reader)
+        df = dict(zip(schema.columns, columns))
+        series.write(df)
+        return
+
+    with series.collection.batch() as batch:
+        for frm in read_csv(schema, sys.stdin, args.chunk_size):
+            series.write(frm, batch=batch)
+
+
+def read_csv(schema, fh, chunk_size, columns=None):
+    """
+    Parse csv content from `fh` and yield frames of at most
+    `chunk_size` rows. `columns` gives the column order in the csv
+    (default to the schema order).
+    """
+    reader = csv.reader(fh)
+    columns = columns or list(schema.columns)
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            return
+        # Parse each column in one go
+        arrays = zip(*rows)
+        df = {
+            name: schema[name].cast(asarray(arr, dtype="U"))
+            for name, arr in zip(columns, arrays)
+        }
+        yield Frame(schema, df)
 
 
 def merge(args):
@@ -567,6 +686,23 @@ def squash(args):
         repo.registry.squash()
 
 
+def repack(args):
+    """
+    Concatenate the segments of the given collections into pack files
+    (past revisions are removed like with `squash`), run `gc` to
+    delete the original files:
+    ```
+    $ lakota repack temperature
+    $ lakota gc
+    ```
+    """
+    repo = get_repo(args)
+    labels = repo.ls() if args.all else args.labels
+    for label in labels:
+        collection = get_collection(repo, label)
+        collection.repack(pack_size=args.pack_size and args.pack_size * 1024 * 1024)
+
+
 def push(args):
     """
     Push (the local repo in `.lakota`) to a remote repo
@@ -627,6 +763,23 @@ def gc(args):
 
 
 def serve(args):
+    """
+    Expose the repository over http, with the flask development server
+    or, with `--asgi`, with uvicorn (see `lakota.asgi`):
+    ```
+    $ lakota serve http://0.0.0.0:8080 --asgi --workers 4
+    ```
+    """
+    if args.asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            exit("Please install uvicorn to run asgi server")
+        from lakota import asgi
+
+        asgi.run(args.repo, args.web_uri, workers=args.workers, debug=args.verbose)
+        return
+
     try:
         from lakota import server
     except ImportError:
@@ -704,6 +857,13 @@ def run():
     parser_export.add_argument(
         "--collection", "-c", nargs="*", help="Export only the given collestion(s)"
     )
+    parser_export.add_argument(
+        "--format",
+        "-f",
+        choices=["csv", "arrow", "parquet"],
+        default="csv",
+        help="Export format (default: csv)",
+    )
     parser_export.set_defaults(func=export)
 
     parser_import = subparsers.add_parser("import")
@@ -739,6 +899,17 @@ def run():
     )
     parser_squash.set_defaults(func=squash)
 
+    # Add repack command
+    parser_repack = subparsers.add_parser("repack")
+    parser_repack.add_argument("labels", nargs="*")
+    parser_repack.add_argument(
+        "-a", "--all", action="store_true", help="Repack all collections"
+    )
+    parser_repack.add_argument(
+        "--pack-size", "-s", type=int, default=None, help="Pack size (in MB)"
+    )
+    parser_repack.set_defaults(func=repack)
+
     # Add push command
     parser_push = subparsers.add_parser("push")
     parser_push.add_argument("remote")
@@ -760,6 +931,16 @@ def run():
     # Add write command
     parser_write = subparsers.add_parser("write")
     parser_write.add_argument("label")
+    parser_write.add_argument(
+        "--chunk-size",
+        "-c",
+        type=int,
+        default=None,
+        help="Stream input by chunks of rows",
+    )
+    parser_write.add_argument(
+        "--create", action="store_true", help="Create series if it does not exist"
+    )
     parser_write.set_defaults(func=write)
 
     # Add merge command
@@ -788,6 +969,12 @@ def run():
     # Add serve command
     parser_serve = subparsers.add_parser("serve")
     parser_serve.add_argument("web_uri", nargs="?", default="http://127.0.0.1:8080")
+    parser_serve.add_argument(
+        "--asgi", action="store_true", help="Use asgi server (needs uvicorn)"
+    )
+    parser_serve.add_argument(
+        "--workers", "-w", type=int, default=1, help="Number of asgi processes"
+    )
     parser_serve.set_defaults(func=serve)
 
     # Add deploy command
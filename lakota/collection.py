@@ -42,20 +42,33 @@ Squash remove past revisions
 ```python
 clct.squash()
 ```
+
+Repack concatenates the payloads of the collection into a few large
+pack files (which is cheaper on object stores with per-request
+pricing), past revisions are also removed. Loose payloads are then
+deleted by `lakota.repo.Repo.gc`.
+```python
+clct.repack()
+repo.gc()
+```
 """
 
 from collections import defaultdict
 from contextlib import contextmanager
 from itertools import chain
+from pathlib import PurePosixPath
 
 from .changelog import Changelog, phi
 from .series import Commit, KVSeries, Series
-from .utils import Pool, hashed_path, logger
+from .utils import Pool, chunky, hashed_path, hexdigest, logger
 
 __all__ = ["Collection", "Batch"]
 
 
 class Collection:
+    # Target size of pack files (see repack)
+    pack_size = 64 * 1024 * 1024
+
     def __init__(self, label, schema, path, repo):
         self.repo = repo
         self.pod = repo.pod
@@ -80,9 +93,8 @@ class Collection:
         rev = self.changelog.leaf()
         if rev is None:
             return []
-        payload = rev.read()
-        ci = Commit.decode(self.schema, payload)
-        return sorted(set(ci.label))
+        ci = rev.commit(self)
+        return list(ci.label_index)
 
     def delete(self, *labels):
         leaf_rev = self.changelog.leaf()
@@ -96,7 +108,7 @@ class Collection:
         return self.changelog.commit(payload, parents=[parent])
 
     def refresh(self):
-        self.changelog.refresh()
+        self.changelog.refresh(full=True)
 
     def push(self, remote, *labels):
         return remote.pull(self, *labels)
@@ -110,7 +122,7 @@ class Collection:
         local_digs = set(self.digests())
         remote_digs = set(remote.digests())
         sync = lambda path: self.pod.write(path, remote.pod.read(path))
-        with Pool() as pool:
+        with Pool(remote.pod) as pool:
             for dig in remote_digs:
                 if dig in local_digs:
                     continue
@@ -150,12 +162,14 @@ class Collection:
         first_ci, *other_ci = [h.commit(self) for h in heads]
         root_ci = root.commit(self) if root else []
         # Pile all rows for all other commit into the first one
+        rows = []
         for ci in other_ci:
             for pos in range(len(ci)):
                 row = ci.at(pos)
                 if row in first_ci or row in root_ci:
                     continue
-                first_ci = first_ci.update(**row)
+                rows.append(row)
+        first_ci = first_ci.update_many(rows)
 
         # encode and commit
         payload = first_ci.encode()
@@ -182,7 +196,7 @@ class Collection:
             leaf = self.changelog.leaf()
             if leaf:
                 self.changelog.pod.clear(leaf.path)
-                self.changelog.refresh()
+                self.changelog.refresh(full=True)
             return []
 
         # Rewrite each series, based on `step` size arrays
@@ -207,16 +221,68 @@ class Collection:
             revs = [leaf]
         skip = [r.path for r in revs]
         self.changelog.pod.clear(*skip)
-        self.changelog.refresh()
+        self.changelog.refresh(full=True)
         return batch.revs
 
+    def repack(self, pack_size=None):
+        """
+        Concatenate the payloads referenced by the last revision into
+        pack files of about `pack_size` bytes and commit the pack
+        index. Like `squash`, past revisions are removed. Returns
+        newly created revisions.
+        """
+        pack_size = pack_size or self.pack_size
+        leaf = self.changelog.leaf()
+        if leaf is None:
+            return []
+        ci = leaf.commit(self)
+        digests = set(chain.from_iterable(ci.digest.values()))
+        digests = sorted(digests - ci.embedded.keys() - ci.packed.keys())
+        if not digests:
+            return []
+
+        packed = dict(ci.packed)
+        buff, index = [], []
+        size = 0
+
+        def write_pack():
+            data = b"".join(buff)
+            pack = hexdigest(data)
+            folder, filename = hashed_path(pack)
+            self.pod.cd(folder).write(filename, data)
+            for dig, offset, length in index:
+                packed[dig] = (pack, offset, length)
+            logger.info("PACK %s (%s payloads)", pack, len(index))
+
+        for chunk in chunky(digests):
+            paths = [str(PurePosixPath(*hashed_path(dig))) for dig in chunk]
+            for dig, data in zip(chunk, self.pod.read_many(paths)):
+                index.append((dig, size, len(data)))
+                buff.append(bytes(data))
+                size += len(data)
+                if size >= pack_size:
+                    write_pack()
+                    buff, index = [], []
+                    size = 0
+        if buff:
+            write_pack()
+
+        new_ci = ci.slice(None, None)
+        new_ci.packed = packed
+        revs = self.changelog.commit(new_ci.encode(), parents=[phi])
+        self.changelog.pod.clear(*(r.path for r in revs))
+        self.changelog.refresh(full=True)
+        return revs
+
     def digests(self):
         for rev in self.changelog.log():
             ci = rev.commit(self)
             digs = set(chain.from_iterable(ci.digest.values()))
-            # return only digest not already embedded in the commit
+            # return only digest not already embedded in the commit,
+            # packed ones are replaced by their pack
             digs = digs - set(ci.embedded)
-            yield from digs
+            packs = {ci.packed[d][0] for d in digs if d in ci.packed}
+            yield from (digs - ci.packed.keys()) | packs
 
     @contextmanager
     def batch(self, root=None):
@@ -232,8 +298,20 @@ class Batch:
         self.revs = None
         self.root = root
 
-    def append(self, label, start, stop, all_dig, frame_len, embedded):
-        self._ci_info.append((label, start, stop, all_dig, frame_len, embedded))
+    def append(
+        self,
+        label,
+        start,
+        stop,
+        all_dig,
+        frame_len,
+        embedded,
+        stats=None,
+        blocks=None,
+    ):
+        self._ci_info.append(
+            (label, start, stop, all_dig, frame_len, embedded, stats, blocks)
+        )
 
     def extend(self, *other_batches):
         for b in other_batches:
@@ -245,26 +323,24 @@ class Batch:
 
         changelog = self.collection.changelog
         leaf_rev = None if self.root else changelog.leaf()
-        all_ci_info = iter(self._ci_info)
 
         # Combine with last commit
         if leaf_rev:
             last_ci = leaf_rev.commit(self.collection)
         else:
-            label, start, stop, all_dig, length, embedded = next(all_ci_info)
-            last_ci = Commit.one(
-                self.collection.schema,
-                label,
-                start,
-                stop,
-                all_dig,
-                length,
-                embedded=embedded,
-            )
-        for label, start, stop, all_dig, length, embedded in all_ci_info:
-            last_ci = last_ci.update(
-                label, start, stop, all_dig, length, embedded=embedded
-            )
+            last_ci = Commit.empty(self.collection.schema)
+        keys = (
+            "label",
+            "start",
+            "stop",
+            "digest",
+            "length",
+            "embedded",
+            "stats",
+            "blocks",
+        )
+        rows = [dict(zip(keys, ci_info)) for ci_info in self._ci_info]
+        last_ci = last_ci.update_many(rows)
 
         # Save it
         payload = last_ci.encode()
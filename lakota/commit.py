@@ -15,6 +15,27 @@ Once one or more rows are identified, the digests allows to know which
 files contain the data we want. We can then read and uncompress those
 and instanciate a dataframe.
 
+Commits are serialized with msgpack. Since version 2 of the format,
+digests are stored as binary strings (20 bytes per digest), labels as
+their distinct values plus the number of rows for each of them and
+`closed` as int8. Commits written with version 1 (where those columns
+are plain strings) are still readable.
+
+Commits also keep some statistics (min, max and number of null
+values) for each payload, keyed by digest (like embedded data). They
+are used to skip segments when a query is filtered with a mask (see
+`lakota.series.Query`).
+
+Payloads can also be packed (see `lakota.collection.Collection.repack`):
+several of them are concatenated in one pack file, and the commit
+`packed` dict gives for each of those digests the pack digest, the
+offset and the length of the payload in the pack.
+
+Large payloads can be written in blocks (see
+`lakota.schema.Codec.encode_blocks`), the commit `blocks` set
+contains the digests of those payloads, so that only the needed
+blocks are fetched and decoded.
+
 Let's use the command line interface to illustrate this:
 
 ```shell
@@ -126,27 +147,103 @@ timestamp,value
 ```
 """
 
+from binascii import hexlify, unhexlify
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from itertools import chain
 from threading import Lock
 
 from numcodecs import registry
-from numpy import asarray, concatenate, isin, where
+from numpy import (
+    asarray,
+    concatenate,
+    datetime64,
+    flatnonzero,
+    floating,
+    frombuffer,
+    isin,
+    isnan,
+    isnat,
+    issubdtype,
+    number,
+    repeat,
+    searchsorted,
+    zeros,
+)
 
 from .frame import Frame
-from .schema import Codec, Schema
-from .utils import Closed, hashed_path
-
-__all__ = ["Commit", "Segment"]
+from .schema import Codec
+from .utils import Closed, Pool, hashed_path, hexhash_len
+
+__all__ = ["Commit", "Segment", "array_stats"]
+
+# Closed values indexed by their flag value (see utils.Closed)
+closed_chars = asarray(["n", "r", "l", "b"])
+
+
+def encode_digests(arr):
+    """
+    Pack an array of hex digests into a binary string (20 bytes per
+    digest)
+    """
+    return unhexlify(asarray(arr, dtype=f"S{hexhash_len}").tobytes())
+
+
+def decode_digests(data):
+    """
+    Unpack a binary string into an array of hex digests
+    """
+    return frombuffer(hexlify(data), dtype=f"S{hexhash_len}").astype("U")
+
+
+def array_stats(arr):
+    """
+    Return a tuple (min, max, null_count) for `arr`, or None if the
+    array is empty, has a non-numerical type or contains only nulls.
+    """
+    if len(arr) == 0:
+        return None
+    if issubdtype(arr.dtype, floating):
+        nulls = isnan(arr)
+    elif issubdtype(arr.dtype, datetime64):
+        nulls = isnat(arr)
+    elif issubdtype(arr.dtype, number):
+        return arr.min(), arr.max(), 0
+    else:
+        return None
+    null_count = int(nulls.sum())
+    if null_count == len(arr):
+        return None
+    if null_count:
+        arr = arr[~nulls]
+    return arr.min(), arr.max(), null_count
 
 
 class Commit:
 
-    digest_codec = Codec("U")  # FIXME use better encoding
+    version = 2
+    # Version 1 codecs (digests, labels and closed are plain strings)
+    digest_codec = Codec("U")
     len_codec = Codec("int")
     label_codec = Codec("str")
-    closed_codec = Codec("str")  # Could be i1
-
-    def __init__(self, schema, label, start, stop, digest, length, closed, embedded):
+    closed_codec = Codec("str")
+    # Version 2 codec for label run lengths
+    count_codec = Codec("int")
+
+    def __init__(
+        self,
+        schema,
+        label,
+        start,
+        stop,
+        digest,
+        length,
+        closed,
+        embedded,
+        stats=None,
+        packed=None,
+        blocks=None,
+    ):
         assert list(digest) == list(schema)
         self.schema = schema
         self.label = label  # Array of str
@@ -156,9 +253,26 @@ class Commit:
         self.length = length  # Array of int
         self.closed = closed  # Array of ("l", "r", "b", "n")
         self.embedded = embedded or {}
+        self.stats = stats or {}  # Dict digest -> (min, max, null count)
+        self.packed = packed or {}  # Dict digest -> (pack, offset, length)
+        self.blocks = set(blocks or ())  # Digests of block payloads
+        self._label_index = None
 
     @classmethod
-    def one(cls, schema, label, start, stop, digest, length, closed="b", embedded=None):
+    def one(
+        cls,
+        schema,
+        label,
+        start,
+        stop,
+        digest,
+        length,
+        closed="b",
+        embedded=None,
+        stats=None,
+        packed=None,
+        blocks=None,
+    ):
         assert closed in ("l", "r", "n", "b")
         label = asarray([label])
         start = dict(zip(schema.idx, (asarray([s]) for s in start)))
@@ -166,7 +280,19 @@ class Commit:
         digest = dict(zip(schema, (asarray([d], dtype="U") for d in digest)))
         length = [length]
         closed = [closed]
-        return Commit(schema, label, start, stop, digest, length, closed, embedded)
+        return Commit(
+            schema,
+            label,
+            start,
+            stop,
+            digest,
+            length,
+            closed,
+            embedded,
+            stats,
+            packed,
+            blocks,
+        )
 
     @classmethod
     def empty(cls, schema):
@@ -174,75 +300,185 @@ class Commit:
         start = dict(zip(schema.idx, (asarray([]) for _ in schema.idx)))
         stop = dict(zip(schema.idx, (asarray([]) for _ in schema.idx)))
         digest = dict(zip(schema, (asarray([]) for _ in schema)))
-        length = []
-        closed = []
-        return Commit(schema, label, start, stop, digest, length, closed)
+        length = asarray([], dtype=int)
+        closed = asarray([], dtype="U")
+        return Commit(schema, label, start, stop, digest, length, closed, None)
 
     @classmethod
     def decode(cls, schema, payload):
         msgpck = registry.codec_registry["msgpack2"]()
         data = msgpck.decode(payload)[0]
+        version = data.get("version", 1)
         values = {}
-        # Decode starts, stops and digests
-        for key in ("start", "stop", "digest"):
-            key_vals = {}
-            columns = schema if key == "digest" else schema.idx
-            for name in columns:
-                codec = cls.digest_codec if key == "digest" else schema[name].codec
-                key_vals[name] = codec.decode(data[key][name])
-            values[key] = key_vals
-
-        # Decode len and labels
+        # Decode starts and stops
+        for key in ("start", "stop"):
+            values[key] = {
+                name: schema[name].codec.decode(data[key][name]) for name in schema.idx
+            }
+
+        # Decode digests, labels and closed
+        if version == 1:
+            values["digest"] = {
+                name: cls.digest_codec.decode(data["digest"][name]) for name in schema
+            }
+            values["label"] = cls.label_codec.decode(data["label"])
+            values["closed"] = cls.closed_codec.decode(data["closed"])
+        else:
+            values["digest"] = {
+                name: decode_digests(data["digest"][name]) for name in schema
+            }
+            labels = cls.label_codec.decode(data["label"]["values"])
+            counts = cls.count_codec.decode(data["label"]["counts"])
+            values["label"] = repeat(labels, counts)
+            values["closed"] = closed_chars[frombuffer(data["closed"], dtype="i1")]
         values["length"] = cls.len_codec.decode(data["length"])
-        values["label"] = cls.label_codec.decode(data["label"])
-        values["closed"] = cls.closed_codec.decode(data["closed"])
 
         # Embedded data will be decoded on demand
         values["embedded"] = data.get("embedded")
+
+        # Decode stats
+        stats = {}
+        for name, col_stats in data.get("stats", {}).items():
+            codec = schema[name].codec
+            digests = decode_digests(col_stats["digest"])
+            mins = codec.decode(col_stats["min"])
+            maxs = codec.decode(col_stats["max"])
+            nulls = cls.len_codec.decode(col_stats["nulls"])
+            stats.update(zip(digests, zip(mins, maxs, nulls)))
+        values["stats"] = stats
+
+        # Decode pack index
+        packed = data.get("packed")
+        if packed:
+            digests = decode_digests(packed["digest"])
+            packs = decode_digests(packed["pack"])
+            offsets = cls.len_codec.decode(packed["offset"])
+            lengths = cls.len_codec.decode(packed["length"])
+            values["packed"] = {
+                d: (p, int(o), int(l))
+                for d, p, o, l in zip(digests, packs, offsets, lengths)
+            }
+
+        # Decode digests of block payloads
+        blocks = data.get("blocks")
+        if blocks:
+            values["blocks"] = set(decode_digests(blocks))
         return Commit(schema, **values)
 
     def encode(self):
         msgpck = registry.codec_registry["msgpack2"]()
-        data = {}
-        # Encode starts, stops and digests
-        for key in ("start", "stop", "digest"):
-            columns = self.schema if key == "digest" else self.schema.idx
-            key_vals = {}
-            for pos, name in enumerate(columns):
-                codec = (
-                    self.digest_codec if key == "digest" else self.schema[name].codec
-                )
-                arr = getattr(self, key)[name]
-                key_vals[name] = codec.encode(arr)
-            data[key] = key_vals
-
-        # Encode digests
-        for name in self.schema:
-            data["digest"][name] = self.digest_codec.encode(self.digest[name])
+        data = {"version": self.version}
+        # Encode starts and stops
+        for key in ("start", "stop"):
+            values = getattr(self, key)
+            data[key] = {
+                name: self.schema[name].codec.encode(values[name])
+                for name in self.schema.idx
+            }
+
+        # Encode digests as binary
+        data["digest"] = {
+            name: encode_digests(self.digest[name]) for name in self.schema
+        }
 
-        # Encode length, closed and labels
+        # Encode length, closed (as int8) and labels (run-length
+        # encoded, as they are sorted)
         data["length"] = self.len_codec.encode(self.length)
-        data["closed"] = self.closed_codec.encode(self.closed)
-        data["label"] = self.label_codec.encode(self.label)
+        closed = asarray(self.closed)
+        codes = zeros(len(closed), dtype="i1")
+        for code, char in enumerate(closed_chars):
+            codes[closed == char] = code
+        data["closed"] = codes.tobytes()
+        bounds = self.label_index.values()
+        data["label"] = {
+            "values": self.label_codec.encode(list(self.label_index)),
+            "counts": self.count_codec.encode([hi - lo for lo, hi in bounds]),
+        }
         # Keep only embedded data referenced by self.digest
         keep_digests = (
             set(chain.from_iterable(self.digest.values())) & self.embedded.keys()
         )
         embedded = {d: self.embedded[d] for d in keep_digests}
         data["embedded"] = embedded
+
+        # Encode stats of the payloads referenced by self.digest, per
+        # column (min and max are encoded with the column codec)
+        data["stats"] = {}
+        for name in self.schema:
+            digests = sorted(set(self.digest[name]) & self.stats.keys())
+            if not digests:
+                continue
+            mins, maxs, nulls = zip(*(self.stats[d] for d in digests))
+            codec = self.schema[name].codec
+            data["stats"][name] = {
+                "digest": encode_digests(digests),
+                "min": codec.encode(asarray(mins)),
+                "max": codec.encode(asarray(maxs)),
+                "nulls": self.len_codec.encode(asarray(nulls)),
+            }
+
+        # Encode pack index of the payloads referenced by self.digest
+        digests = sorted(
+            set(chain.from_iterable(self.digest.values())) & self.packed.keys()
+        )
+        if digests:
+            packs, offsets, lengths = zip(*(self.packed[d] for d in digests))
+            data["packed"] = {
+                "digest": encode_digests(digests),
+                "pack": encode_digests(packs),
+                "offset": self.len_codec.encode(asarray(offsets)),
+                "length": self.len_codec.encode(asarray(lengths)),
+            }
+
+        # Encode digests of the block payloads referenced by self.digest
+        digests = sorted(set(chain.from_iterable(self.digest.values())) & self.blocks)
+        if digests:
+            data["blocks"] = encode_digests(digests)
         return msgpck.encode([data])
 
+    @property
+    def label_index(self):
+        """
+        Dict of label -> (first_row, last_row + 1), lazily built
+        (labels are sorted so each label is a contiguous block of rows)
+        """
+        if self._label_index is not None:
+            return self._label_index
+        if len(self) == 0:
+            self._label_index = {}
+            return self._label_index
+        bounds = [0, *(flatnonzero(self.label[1:] != self.label[:-1]) + 1), len(self)]
+        self._label_index = {
+            self.label[lo]: (lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])
+        }
+        return self._label_index
+
+    def label_range(self, label):
+        """
+        Return the positions (first row, last row + 1) of `label`. If
+        `label` is not present both positions are equal to its
+        insertion point.
+        """
+        rng = self.label_index.get(label)
+        if rng is not None:
+            return rng
+        pos = int(searchsorted(self.label, label)) if len(self) else 0
+        return pos, pos
+
     def split(self, label, start, stop):
-        start_values = {"_label": self.label}
-        start_values.update(self.start)
-        stop_values = {"_label": self.label}
-        stop_values.update(self.stop)
-        frm_start = Frame(Schema.from_frame(start_values), start_values)
-        frm_stop = Frame(Schema.from_frame(stop_values), stop_values)
-        start_pos = frm_stop.index((label,) + start, right=True)
-        stop_pos = frm_start.index((label,) + stop, right=False)
+        lo, hi = self.label_range(label)
+        start_pos = self._bisect(self.stop, start, lo, hi, right=True)
+        stop_pos = self._bisect(self.start, stop, lo, hi, right=False)
         return start_pos, stop_pos
 
+    def _bisect(self, columns, values, lo, hi, right=False):
+        # Like Frame.index, but restricted to rows between lo and hi
+        for name, val in zip(self.schema.idx, values):
+            arr = columns[name]
+            lo = bisect_left(arr, val, lo=lo, hi=hi)
+            hi = bisect_right(arr, val, lo=lo, hi=hi)
+        return hi if right else lo
+
     def __len__(self):
         return len(self.label)
 
@@ -258,21 +494,43 @@ class Commit:
         for key in ("label", "length", "closed"):
             res[key] = getattr(self, key)[pos]
         res["embedded"] = self.embedded
+        res["stats"] = self.stats
+        res["packed"] = self.packed
+        res["blocks"] = self.blocks
         return res
 
-    def update(self, label, start, stop, digest, length, closed="b", embedded=None):
+    def update(
+        self,
+        label,
+        start,
+        stop,
+        digest,
+        length,
+        closed="b",
+        embedded=None,
+        stats=None,
+        packed=None,
+        blocks=None,
+    ):
         assert closed == "b", "Non-closed updates not supported"
         if not start <= stop:
             raise ValueError(f"Invalid range {start} -> {stop}")
         inner = Commit.one(
-            self.schema, label, start, stop, digest, length, closed, embedded
+            self.schema,
+            label,
+            start,
+            stop,
+            digest,
+            length,
+            closed,
+            embedded,
+            stats,
+            packed,
+            blocks,
         )
         if len(self) == 0:
             return inner
 
-        if embedded:
-            self.embedded.update(embedded)
-
         first = (self.at(0)["label"], self.at(0)["start"])
         last = (self.at(-1)["label"], self.at(-1)["stop"])
         if (label, start) <= first and (label, stop) >= last:
@@ -354,6 +612,32 @@ class Commit:
             tail = self.tail(stop_pos)
         return Commit.concat(head, inner, tail)
 
+    def update_many(self, rows):
+        """
+        Apply several updates at once, `rows` is a list of dicts whose
+        keys are `update` arguments. Updates are grouped by label and
+        applied (in order) on the rows of their label only, then the
+        new commit is assembled in one pass.
+        """
+        by_label = defaultdict(list)
+        for row in rows:
+            by_label[row["label"]].append(row)
+        if not by_label:
+            return self
+
+        pieces = []
+        pos = 0
+        for label in sorted(by_label):
+            lo, hi = self.label_range(label)
+            label_ci = self.slice(lo, hi)
+            for row in by_label[label]:
+                label_ci = label_ci.update(**row)
+            pieces.append(self.slice(pos, lo))
+            pieces.append(label_ci)
+            pos = hi
+        pieces.append(self.tail(pos))
+        return Commit.concat(*pieces)
+
     def slice(self, *pos):
         slc = slice(*pos)
         schema = self.schema
@@ -363,7 +647,19 @@ class Commit:
         label = self.label[slc]
         length = self.length[slc]
         closed = self.closed[slc]
-        return Commit(schema, label, start, stop, digest, length, closed, self.embedded)
+        return Commit(
+            schema,
+            label,
+            start,
+            stop,
+            digest,
+            length,
+            closed,
+            self.embedded,
+            self.stats,
+            self.packed,
+            self.blocks,
+        )
 
     def head(self, pos):
         return self.slice(None, pos)
@@ -399,9 +695,27 @@ class Commit:
         length = concatenate([ci.length for ci in all_ci])
         closed = concatenate([ci.closed for ci in all_ci])
         embedded = {}
+        stats = {}
+        packed = {}
+        blocks = set()
         for ci in all_ci:
             embedded.update(ci.embedded)
-        return Commit(schema, label, start, stop, digest, length, closed, embedded)
+            stats.update(ci.stats)
+            packed.update(ci.packed)
+            blocks.update(ci.blocks)
+        return Commit(
+            schema,
+            label,
+            start,
+            stop,
+            digest,
+            length,
+            closed,
+            embedded,
+            stats,
+            packed,
+            blocks,
+        )
 
     def __repr__(self):
         fmt = lambda a: "/".join(map(str, a))
@@ -423,11 +737,14 @@ class Commit:
         if stop is None:
             closed = closed.set_right(Closed.RIGHT)
         res = []
-        (matches,) = where(self.label == label)
-        for pos in matches:
+        for pos in range(*self.label_range(label)):
             arr_start = tuple(arr[pos] for arr in self.start.values())
             arr_stop = tuple(arr[pos] for arr in self.stop.values())
             arr_closed = Closed[self.closed[pos]]
+            # Rows closed on both sides and not cut by start or stop
+            # cover their arrays entirely, so the commit length can be
+            # used as segment length
+            length = self.length[pos] if arr_closed == Closed.BOTH else None
             if start:
                 if start > arr_stop:
                     # start is on the right of the array
@@ -439,6 +756,7 @@ class Commit:
                     # closed "win" over arr_closed on the left
                     arr_closed = arr_closed.set_left(closed)
                     arr_start = start
+                    length = None
 
             if stop:
                 if stop < arr_start:
@@ -449,6 +767,7 @@ class Commit:
                     # closed "win" over arr_closed on the right
                     arr_closed = arr_closed.set_right(closed)
                     arr_stop = stop
+                    length = None
 
             digest = [arr[pos] for arr in self.digest.values()]
             sgm = Segment(
@@ -458,6 +777,7 @@ class Commit:
                 start=arr_start,
                 stop=arr_stop,
                 closed=arr_closed,
+                length=length,
             )
             res.append(sgm)
         return res
@@ -473,6 +793,9 @@ class Commit:
             length=self.length[keep],
             closed=self.closed[keep],
             embedded=self.embedded,
+            stats=self.stats,
+            packed=self.packed,
+            blocks=self.blocks,
         )
 
     def __contains__(self, row):
@@ -486,37 +809,201 @@ class Commit:
         return True
 
 
+class LazyPayload:
+    """
+    Bytes-like access to a file (or to `length` bytes starting at
+    `offset` in it, for packed payloads), slices are fetched with
+    `POD.read_range`. The beginning of the payload is read once and
+    kept, as it contains the header of block payloads (see
+    `lakota.schema.Codec.encode_blocks`).
+    """
+
+    head_size = 64 * 1024
+
+    def __init__(self, pod, relpath, offset=0, length=None):
+        self.pod = pod
+        self.relpath = relpath
+        self.offset = offset
+        self.length = length
+        self._head = None
+        self._full = None
+
+    def _read(self, start, length=None):
+        if self.length is not None:
+            end = self.length if length is None else min(start + length, self.length)
+            length = max(end - start, 0)
+        return self.pod.read_range(self.relpath, self.offset + start, length)
+
+    def __getitem__(self, key):
+        if self._full is not None:
+            return self._full[key]
+        if self._head is None:
+            self._head = self._read(0, self.head_size)
+            if len(self._head) < self.head_size:
+                # We got the whole payload
+                self._full = self._head
+                return self._full[key]
+
+        start = key.start or 0
+        if key.stop is not None and key.stop <= len(self._head):
+            return self._head[key]
+        if start == 0 and key.stop is None:
+            self._full = self._read(0)
+            return self._full
+        length = None if key.stop is None else key.stop - start
+        return self._read(start, length)
+
+
 class Segment:
-    def __init__(self, commit, pod, digests, start, stop, closed):
+    def __init__(self, commit, pod, digests, start, stop, closed, length=None):
         self.commit = commit
         self.pod = pod
         self.start = start
         self.stop = stop
         self.closed = closed
+        # Number of rows, when known without reading the segment
+        self.length = None if length is None else int(length)
         self.digest = dict(zip(commit.schema, digests))
         self._frm = None
+        self._payloads = {}
         self.start_pos = None
         self.stop_pos = None
         self.lock = Lock()
 
+    @classmethod
+    def prefetch(cls, segments, names):
+        """
+        Read in one batch (see `POD.read_many`) the payloads of the
+        columns `names` for all the segments. Block payloads are
+        skipped if the pod supports ranged reads (only the needed
+        blocks are fetched then).
+        """
+        if not segments:
+            return
+        ranged = segments[0].pod.ranged
+        todo = {}
+        packed = {}
+        for sgm in segments:
+            for name in names:
+                dig = sgm.digest[name]
+                if dig in sgm.commit.embedded or name in sgm._payloads:
+                    continue
+                if ranged and dig in sgm.commit.blocks:
+                    continue
+                if sgm._frm is not None and name in sgm._frm:
+                    continue
+                if dig in sgm.commit.packed:
+                    packed.setdefault(sgm.commit.packed[dig], []).append((sgm, name))
+                    continue
+                folder, filename = hashed_path(dig)
+                todo.setdefault(str(folder / filename), []).append((sgm, name))
+
+        pod = segments[0].pod
+        if todo:
+            for path, data in zip(todo, pod.read_many(list(todo))):
+                for sgm, name in todo[path]:
+                    sgm._payloads[name] = data
+        if packed:
+            # Read packed payloads concurrently
+            with Pool(pod) as pool:
+                for pack, offset, length in packed:
+                    folder, filename = hashed_path(pack)
+                    pool.submit(pod.cd(folder).read_range, filename, offset, length)
+            for key, data in zip(packed, pool.results):
+                for sgm, name in packed[key]:
+                    sgm._payloads[name] = data
+
     def __len__(self):
+        if self.length is not None:
+            return self.length
         return len(self.frame)
 
+    def release(self):
+        """
+        Drop decoded columns and prefetched payloads (the segment can
+        still be read afterwards)
+        """
+        with self.lock:
+            self._frm = None
+            self._payloads.clear()
+            self.start_pos = self.stop_pos = None
+
+    @property
+    def stats(self):
+        """
+        Dict of column name -> (min, max, null count), only columns
+        with known stats are present.
+        """
+        stats = self.commit.stats
+        return {name: stats[dig] for name, dig in self.digest.items() if dig in stats}
+
     def read(self, name, start_pos=None, stop_pos=None):
+        blocks = self.digest[name] in self.commit.blocks
+        if blocks and self._frm is None and self.length is not None:
+            # Segment is not cut, rows of block payloads can be
+            # decoded without reading the index
+            data = self._payloads.get(name)
+            if data is None:
+                data = self._payloads[name] = self._data(name)
+            codec = self.commit.schema[name].codec
+            if stop_pos is not None:
+                stop_pos = min(stop_pos, self.length)
+            return codec.decode_rows(data, start_pos, stop_pos, blocks=True)
         # Prime cache
         if not name in self.frame:
             self.frame[name] = self._read(name)
         return self.frame[name][start_pos:stop_pos]
 
     def _read(self, name):
+        data = self._data(name)
+        codec = self.commit.schema[name].codec
+        blocks = self.digest[name] in self.commit.blocks
+        return codec.decode_rows(data, self.start_pos, self.stop_pos, blocks=blocks)
+
+    def _data(self, name):
         dig = self.digest[name]
         # check first if content is not already in commit
         data = self.commit.embedded.get(dig)
         if data is None:
+            data = self._payloads.pop(name, None)
+        if data is None:
+            blocks = dig in self.commit.blocks
+            pack = self.commit.packed.get(dig)
+            if pack is None:
+                offset = length = None
+            else:
+                dig, offset, length = pack
             folder, filename = hashed_path(dig)
-            data = self.pod.cd(folder).read(filename)
-        arr = self.commit.schema[name].codec.decode(data)
-        return arr[self.start_pos : self.stop_pos]
+            pod = self.pod.cd(folder)
+            if blocks and self.pod.ranged:
+                # Only fetch the blocks that are decoded
+                return LazyPayload(pod, filename, offset or 0, length)
+            if pack is None:
+                data = pod.mmap(filename)
+            else:
+                data = pod.read_range(filename, offset, length)
+        return data
+
+    def _block_range(self, name, data):
+        """
+        Use block bounds of the first index column to find the rows
+        that can contain values between start and stop.
+        """
+        if self.digest[name] not in self.commit.blocks:
+            return None, None
+        header, _ = Codec.read_header(data)
+        if "min" not in header:
+            return None, None
+        codec = self.commit.schema[name].codec
+        rows = header["rows"]
+        first, last = 0, len(rows) - 1
+        if self.start:
+            first = bisect_left(codec.decode(header["max"]), self.start[0])
+        if self.stop:
+            last = bisect_right(codec.decode(header["min"]), self.stop[0])
+        if first >= last:
+            return rows[first], rows[first]
+        return rows[first], rows[last]
 
     @property
     def frame(self):
@@ -529,12 +1016,21 @@ class Segment:
             # with Pool() as pool: # TODO need a smarter pool
             #     for name in self.commit.schema.idx:
             #         pool.submit(lambda: cols.update({name: self._read(name)}))
-            for name in self.commit.schema.idx:
-                cols[name] =  self._read(name)
+            lo = hi = None
+            for pos, name in enumerate(self.commit.schema.idx):
+                data = self._data(name)
+                if pos == 0:
+                    # Only decode blocks that can match
+                    lo, hi = self._block_range(name, data)
+                codec = self.commit.schema[name].codec
+                blocks = self.digest[name] in self.commit.blocks
+                cols[name] = codec.decode_rows(data, lo, hi, blocks=blocks)
 
             frm = Frame(self.commit.schema, cols)
-            self.start_pos, self.stop_pos = frm.index_slice(
+            start_pos, stop_pos = frm.index_slice(
                 self.start, self.stop, closed=self.closed
             )
-            self._frm = frm.slice(self.start_pos, self.stop_pos)
+            self.start_pos = start_pos + (lo or 0)
+            self.stop_pos = stop_pos + (lo or 0)
+            self._frm = frm.slice(start_pos, stop_pos)
             return self._frm
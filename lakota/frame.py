@@ -2,6 +2,7 @@
 from bisect import bisect_left, bisect_right
 from collections import defaultdict
 
+import msgpack
 from numpy import argsort, array_equal, asarray, concatenate, ndarray, rec, unique, arange
 
 from .schema import Schema
@@ -13,6 +14,11 @@ try:
 except ImportError:
     DataFrame = None
 
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 __all__ = ["Frame"]
 
 
@@ -31,10 +37,26 @@ class Frame:
 
     @classmethod
     def from_segments(cls, schema, segments, limit=None, offset=None, select=None):
+        # Drop leading segments skipped by offset when their length is
+        # known (so they are not fetched)
+        if offset and segments:
+            pos = 0
+            while pos < len(segments) and segments[pos].length is not None:
+                if offset < segments[pos].length:
+                    break
+                offset -= segments[pos].length
+                pos += 1
+            segments = segments[pos:]
         if not segments:
             return Frame(schema)
         select = select or schema.columns
-        with Pool() as pool:
+        if limit is None:
+            # Fetch all payloads at once
+            from .commit import Segment
+
+            names = [n for n in schema.columns if n in select or n in schema.idx]
+            Segment.prefetch(segments, names)
+        with Pool(segments[0].pod) as pool:
             for name in schema.columns:
                 if name not in select:
                     continue
@@ -54,23 +76,69 @@ class Frame:
         for sgm in segments:
             if stop == 0:
                 break
-            if start >= len(sgm):
-                start = max(start - len(sgm), 0)
-                if stop is not None:
-                    stop = max(stop - len(sgm), 0)
-                continue
-            arr = sgm.read(name, start_pos=start, stop_pos=stop)
-            start = max(start - len(sgm), 0)
+            # Segment length is known without decoding when the
+            # segment is not cut by start or stop (see `Segment`)
+            size = len(sgm)
+            if start < size:
+                arrays.append(sgm.read(name, start_pos=start, stop_pos=stop))
+            start = max(start - size, 0)
             if stop is not None:
-                stop = max(stop - len(sgm), 0)
-            arrays.append(arr)
+                stop = max(stop - size, 0)
         return name, concatenate(arrays) if arrays else []
 
+    @classmethod
+    def from_arrow(cls, schema, data):
+        """
+        Instanciate a frame based on an arrow table or record batch
+        (numerical and datetime columns without nulls are not copied)
+        """
+        columns = {}
+        for name, arr in zip(data.schema.names, data.columns):
+            if isinstance(arr, pyarrow.ChunkedArray):
+                arr = arr.combine_chunks()
+            columns[name] = arr.to_numpy(zero_copy_only=False)
+        return Frame(schema, columns)
+
+    @classmethod
+    def decode(cls, payload):
+        """
+        Instanciate a frame from a payload created by `Frame.encode`
+        """
+        data = msgpack.unpackb(payload)
+        schema = Schema.loads(data["schema"])
+        columns = {
+            name: schema[name].codec.decode(arr)
+            for name, arr in data["columns"].items()
+        }
+        return Frame(schema, columns)
+
+    def encode(self):
+        """
+        Serialize frame into bytes, each column is encoded with the codecs
+        defined in the schema
+        """
+        columns = {
+            name: self.schema[name].codec.encode(arr)
+            for name, arr in self.columns.items()
+        }
+        return msgpack.packb({"schema": self.schema.dump(), "columns": columns})
+
     def df(self, *columns):
         if DataFrame is None:
             raise ModuleNotFoundError("No module named 'pandas'")
         return DataFrame({c: self[c] for c in self.schema.columns})
 
+    def to_arrow(self):
+        """
+        Return an arrow table (numerical and datetime columns are not
+        copied)
+        """
+        if pyarrow is None:
+            raise ModuleNotFoundError("No module named 'pyarrow'")
+        names = list(self.columns)
+        arrays = [pyarrow.array(self.columns[n]) for n in names]
+        return pyarrow.Table.from_arrays(arrays, names=names)
+
     def argsort(self):
         idx_cols = list(self.schema.idx)
         arr = rec.fromarrays([self[n] for n in idx_cols], names=idx_cols)
@@ -1,29 +1,69 @@
 from pathlib import PurePosixPath
 
+import msgpack
 import requests
+from numcodecs import registry
 
 from .pod import POD
-from .utils import logger
+from .utils import LRU, content_etag, logger
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING
+except ImportError:
+    ACCEPT_ENCODING = ""
+
+# urllib3 decompress zstd responses itself if a zstd module is available
+auto_zstd = "zstd" in ACCEPT_ENCODING
 
 
 class HttpPOD(POD):
 
     protocol = "http"
-
-    def __init__(self, base_uri, path=None, session=None):
+    workers = 8
+    ranged = True
+    # Number of payloads kept in the local cache, their total size
+    # and max size of a cached payload
+    cache_size = 1024
+    cache_bytes = 64 * 1024 * 1024
+    cache_item_size = 1024 * 1024
+
+    def __init__(self, base_uri, path=None, session=None, cache=None):
         self.base_uri = base_uri if base_uri.endswith("/") else base_uri + "/"
         self.path = path or PurePosixPath("")
         self.session = session or requests.Session()
+        # Maps path to (etag, payload)
+        if cache is None:
+            cache = LRU(
+                self.cache_size,
+                max_bytes=self.cache_bytes,
+                weigh=lambda item: len(item[1]),
+            )
+        self.cache = cache
         super().__init__()
 
     def cd(self, *others):
         path = self.path.joinpath(*others)
-        return HttpPOD(self.base_uri, path, session=self.session)
+        return HttpPOD(self.base_uri, path, session=self.session, cache=self.cache)
 
-    def ls(self, relpath=".", missing_ok=False):
+    def _lines(self, resp):
+        content = resp.content
+        if resp.headers.get("Content-Encoding") == "zstd" and not auto_zstd:
+            content = registry.codec_registry["zstd"]().decode(content)
+        return bytes(content).decode().splitlines()
+
+    def _cache(self, path, resp):
+        etag = resp.headers.get("ETag")
+        if etag and len(resp.content) <= self.cache_item_size:
+            self.cache.set(path, (etag, resp.content))
+
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
         logger.debug("LIST %s://%s %s", self.protocol, self.path, relpath)
         params = {"path": str(self.path / relpath)}
-        resp = self.session.get(self.base_uri + "ls", params=params)
+        if start_after is not None:
+            params["start_after"] = start_after
+        resp = self.session.get(
+            self.base_uri + "ls", params=params, headers={"Accept-Encoding": "zstd"}
+        )
 
         if resp.status_code == 404:
             if missing_ok:
@@ -32,30 +72,125 @@ class HttpPOD(POD):
         else:
             resp.raise_for_status()
 
-        return resp.text.splitlines()
+        return self._lines(resp)
 
     def read(self, relpath, mode="rb"):
+        path = str(self.path / relpath)
+        cached = self.cache.get(path)
+        headers = {}
+        if cached is not None:
+            etag, payload = cached
+            if content_etag(path):
+                # Segments are immutable
+                return payload
+            headers["If-None-Match"] = etag
+
         logger.debug("READ %s://%s %s", self.protocol, self.path, relpath)
-        params = {"path": str(self.path / relpath)}
-        resp = self.session.get(self.base_uri + "read", params=params)
+        params = {"path": path}
+        resp = self.session.get(self.base_uri + "read", params=params, headers=headers)
 
-        if resp.status_code == 404:
+        if resp.status_code == 304:
+            return payload
+        elif resp.status_code == 404:
+            self.cache.pop(path)
             raise FileNotFoundError(f"{relpath} not found")
         else:
             resp.raise_for_status()
+        self._cache(path, resp)
         return resp.content
 
+    def read_range(self, relpath, offset, length=None):
+        if length == 0:
+            return b""
+        path = str(self.path / relpath)
+        cached = self.cache.get(path)
+        if cached is not None and content_etag(path):
+            stop = None if length is None else offset + length
+            return cached[1][offset:stop]
+
+        logger.debug(
+            "READ %s://%s %s [%s:+%s]",
+            self.protocol,
+            self.path,
+            relpath,
+            offset,
+            length,
+        )
+        last = "" if length is None else offset + length - 1
+        headers = {"Range": f"bytes={offset}-{last}"}
+        params = {"path": path}
+        resp = self.session.get(self.base_uri + "read", params=params, headers=headers)
+        if resp.status_code == 404:
+            raise FileNotFoundError(f"{relpath} not found")
+        elif resp.status_code == 416:
+            # Range starts after the end of the file
+            return b""
+        else:
+            resp.raise_for_status()
+        if resp.status_code == 206:
+            return resp.content
+        # Server ignored the range
+        stop = None if length is None else offset + length
+        return resp.content[offset:stop]
+
+    def read_many(self, relpaths):
+        if not relpaths:
+            return []
+        paths = [str(self.path / relpath) for relpath in relpaths]
+        # Serve cached segments locally
+        res = {}
+        for path in paths:
+            cached = content_etag(path) and self.cache.get(path)
+            if cached:
+                res[path] = cached[1]
+        missing = [path for path in paths if path not in res]
+        if missing:
+            logger.debug(
+                "READ %s://%s (%s files)", self.protocol, self.path, len(missing)
+            )
+            resp = self.session.post(
+                self.base_uri + "read_many", data=msgpack.packb(missing)
+            )
+            if resp.status_code == 404:
+                raise FileNotFoundError(f"One of {relpaths} not found")
+            else:
+                resp.raise_for_status()
+            for path, payload in zip(missing, msgpack.unpackb(resp.content)):
+                res[path] = payload
+                etag = content_etag(path)
+                if etag and len(payload) <= self.cache_item_size:
+                    self.cache.set(path, (etag, payload))
+        return [res[path] for path in paths]
+
     def write(self, relpath, data, mode="wb"):
         logger.debug("WRITE %s://%s %s", self.protocol, self.path, relpath)
         path = str(self.path / relpath)
+        self.cache.pop(path)
         params = {"path": str(path)}
         resp = self.session.post(self.base_uri + "write", params=params, data=data)
         resp.raise_for_status()
         return int(resp.content) if resp.content else None
 
+    def write_many(self, items):
+        if not items:
+            return []
+        logger.debug("WRITE %s://%s (%s files)", self.protocol, self.path, len(items))
+        items = [(str(self.path / relpath), data) for relpath, data in items]
+        for path, _ in items:
+            self.cache.pop(path)
+        resp = self.session.post(
+            self.base_uri + "write_many", data=msgpack.packb(items)
+        )
+        resp.raise_for_status()
+        return msgpack.unpackb(resp.content)
+
     def rm(self, relpath=".", recursive=False, missing_ok=False):
         logger.debug("REMOVE %s://%s %s", self.protocol, self.path, relpath)
         path = str(self.path / relpath)
+        if recursive:
+            self.cache.clear()
+        else:
+            self.cache.pop(path)
         params = {
             "recursive": "true" if recursive else "",
             "missing_ok": "true" if missing_ok else "",
@@ -72,6 +207,22 @@ class HttpPOD(POD):
         if max_depth is not None:
             params["max_depth"] = str(max_depth)
 
-        resp = self.session.get(self.base_uri + "walk", params=params)
+        resp = self.session.get(
+            self.base_uri + "walk", params=params, headers={"Accept-Encoding": "zstd"}
+        )
         resp.raise_for_status()
-        return resp.text.splitlines()
+        return self._lines(resp)
+
+    def query(self, params, action="query"):
+        """
+        Run a query on the server side (see `lakota.http_repo`), returns
+        the encoded result frame (or number of rows, for the "len"
+        action)
+        """
+        logger.debug("QUERY %s://%s %s", self.protocol, self.path, params)
+        resp = self.session.post(self.base_uri + action, data=msgpack.packb(params))
+        if resp.status_code == 404:
+            raise FileNotFoundError(f"Collection {params['collection']} not found")
+        else:
+            resp.raise_for_status()
+        return resp.content
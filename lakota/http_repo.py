@@ -0,0 +1,124 @@
+"""
+The http_repo sub-module provides `HttpRepo`, a repository that runs
+its reads on the server side (see `lakota.server` and `lakota.asgi`)
+so only the resulting frame is transferred over the network:
+
+```python
+repo = HttpRepo("http://localhost:8080")
+series = repo / "temperature" / "Brussels"
+# Only one row per year is sent back by the server
+frm = series.frame(reduce=['(floor self.timestamp "Y")', "(max self.value)"])
+```
+
+Queries are sent as a msgpack payload on the `query` action, the
+response body is the result encoded with `Frame.encode`. The `len`
+action takes the same payload and returns the (msgpack encoded)
+number of rows. Writes and everything else go through the usual
+`lakota.http_pod.HttpPOD` actions.
+"""
+
+import msgpack
+
+from .collection import Collection
+from .frame import Frame
+from .repo import Repo
+from .schema import Schema
+from .series import KVSeries, Query, Series
+
+__all__ = ["HttpRepo", "run_query"]
+
+
+def run_query(repo, params, action="query"):
+    """
+    Server-side part of `HttpQuery`: execute the query described by
+    `params` on `repo` and return the encoded result frame (or the
+    msgpack encoded number of rows if `action` is "len")
+    """
+    params = dict(params)
+    label = params.pop("collection")
+    collection = repo / label
+    if collection is None:
+        raise FileNotFoundError(f"Collection {label} not found")
+    series = collection / params.pop("series")
+    qr = series.query(**params)
+    if action == "len":
+        # Reduced frames don't map to segment rows
+        length = len(qr.frame()) if params.get("reduce") else len(qr)
+        return msgpack.packb(length)
+    return qr.frame().encode()
+
+
+class HttpQuery(Query):
+    """
+    Query whose frames are computed by the server. When paginating,
+    each page is a server-side query, so pages always contain `step`
+    filtered rows (until the last one).
+    """
+
+    def _run(self, action="query"):
+        schema = self.series.schema
+        params = dict(self.params)
+        for key in ("start", "stop"):
+            if key in params:
+                params[key] = schema.serialize(params[key])
+        params["collection"] = self.series.collection.label
+        params["series"] = self.series.label
+        pod = self.series.collection.repo.pod
+        return pod.query(params, action=action)
+
+    def frame(self, **kw):
+        qr = self @ kw
+        return Frame.decode(qr._run())
+
+    def __len__(self):
+        # Only the number of rows is sent back
+        return msgpack.unpackb(self._run("len"))
+
+    def paginate(self, step=100_000, **kw):
+        if step <= 0:
+            raise ValueError("step argument must be > 0")
+        qr = self @ kw
+        limit = qr.params.get("limit")
+        pos = qr.params.get("offset") or 0
+        while True:
+            # The server applies the mask first, then offset and limit
+            # (like `Query.frame` and `Query.paginate`)
+            lmt = step if limit is None else min(step, limit)
+            frm = qr.frame(limit=lmt, offset=pos)
+            if len(frm) == 0:
+                return
+            if limit is not None:
+                # frm can be shorter than lmt if reduce is set
+                limit -= lmt
+            pos += step
+            yield frm
+
+
+class HttpSeries(Series):
+    def query(self, **kw):
+        return HttpQuery(self, **kw)
+
+
+class HttpKVSeries(KVSeries):
+    def query(self, **kw):
+        return HttpQuery(self, **kw)
+
+
+class HttpCollection(Collection):
+    def series(self, label):
+        label = label.strip()
+        if len(label) == 0:
+            raise ValueError(f"Invalid label")
+        cls = HttpKVSeries if self.schema.kind == "kv" else HttpSeries
+        return cls(label, self)
+
+
+class HttpRepo(Repo):
+    """
+    Repository backed by a lakota server, series reads are executed
+    remotely
+    """
+
+    def reify(self, name, meta):
+        schema = Schema.loads(meta["schema"])
+        return HttpCollection(name, schema, meta["path"], self)
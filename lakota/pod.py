@@ -16,9 +16,15 @@ path.
 It is mainly used through the `lakota.Repo` class.
 """
 import io
+import json
+import mmap
 import os
 import shutil
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path, PurePosixPath
+from threading import BoundedSemaphore, Lock
+from time import sleep, time
 from urllib.parse import parse_qs, urlsplit
 from uuid import uuid4
 
@@ -32,13 +38,19 @@ try:
 except ImportError:
     requests = None
 
-from .utils import logger
+from .utils import LRU, Pool, logger, segment_re, settings
 
 __all__ = ["POD"]
 
 
 class POD:
     _by_token = {}
+    # Number of threads used to access the pod concurrently (see
+    # utils.Pool), can be overridden with `settings.workers`
+    workers = 4
+    # True if read_range only transfers the requested bytes (and is
+    # worth an extra round-trip)
+    ranged = False
 
     def __init__(self):
         self.token = str(uuid4())
@@ -53,9 +65,19 @@ class POD:
         # multi-uri -> CachePOD
         if isinstance(uri, (tuple, list)):
             if len(uri) > 1:
+                # The local uri may define a size limit (in bytes),
+                # a ttl (in seconds) for listings. `write_behind=true`
+                # enables background uploads
+                params = parse_qs(urlsplit(uri[0]).query)
+                max_size = params.get("max_size")
+                ttl = params.get("ttl")
+                write_behind = params.get("write_behind", [""])[0].lower()
                 return CachePOD(
                     local=POD.from_uri(uri[0], **fs_kwargs),
                     remote=POD.from_uri(uri[1:], **fs_kwargs),
+                    max_size=max_size and int(max_size[0]),
+                    ttl=ttl and float(ttl[0]),
+                    write_behind=write_behind in ("1", "true"),
                 )
             else:
                 return POD.from_uri(uri[0], **fs_kwargs)
@@ -107,6 +129,10 @@ class POD:
         else:
             raise ValueError(f'Protocol "{scheme}" not supported')
 
+    @property
+    def max_workers(self):
+        return settings.workers.get(self.protocol, self.workers)
+
     def __truediv__(self, relpath):
         return self.cd(relpath)
 
@@ -116,6 +142,63 @@ class POD:
                 continue
             self.rm(key, recursive=True)
 
+    def read_many(self, relpaths):
+        """
+        Read several files at once, returns a list of payloads (in the
+        same order as `relpaths`). Subclasses may override it to issue
+        concurrent or batched requests.
+        """
+        return [self.read(relpath) for relpath in relpaths]
+
+    def write_many(self, items):
+        """
+        Write all the (relpath, data) pairs of `items` (concurrently),
+        return the list of `write` results. Pods may override it to
+        save round-trips.
+        """
+        with Pool(self) as pool:
+            for relpath, data in items:
+                pool.submit(self.write, relpath, data)
+        return pool.results
+
+    def read_range(self, relpath, offset, length=None):
+        """
+        Read `length` bytes of `relpath` starting at `offset` (or up to
+        the end of the file if `length` is None). Pods where
+        `ranged` is true read only the requested bytes, others read
+        the whole file and slice it.
+        """
+        data = self.read(relpath)
+        stop = None if length is None else offset + length
+        return data[offset:stop]
+
+    def size(self, relpath):
+        """
+        Return the size (in bytes) of `relpath`
+        """
+        return len(self.read(relpath))
+
+    def mmap(self, relpath):
+        """
+        Return the content of `relpath` as a buffer, FilePOD returns a
+        memory-mapped view (that avoids copying large files in memory)
+        """
+        return self.read(relpath)
+
+    def flush(self):
+        """
+        Wait for pending writes (see CachePOD write-behind mode)
+        """
+        pass
+
+    def replace(self, relpath, data):
+        """
+        Write `data` to `relpath`, overwriting any existing content
+        (atomically on FilePOD and MemPOD)
+        """
+        self.rm(relpath, missing_ok=True)
+        return self.write(relpath, data)
+
     def walk(self, max_depth=None):
         if max_depth == 0:
             return []
@@ -148,15 +231,18 @@ class FilePOD(POD):
         path = self.path.joinpath(*others)
         return FilePOD(path)
 
-    def ls(self, relpath=".", missing_ok=False):
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
         logger.debug("LIST %s %s", self.path, relpath)
         path = self.path / relpath
         try:
-            return list(p.name for p in path.iterdir())
+            names = [p.name for p in path.iterdir()]
         except FileNotFoundError:
             if missing_ok:
                 return []
             raise
+        if start_after is not None:
+            return sorted(n for n in names if n > start_after)
+        return names
 
     def read(self, relpath, mode="rb"):
         logger.debug("READ %s %s", self.path, relpath)
@@ -164,14 +250,60 @@ class FilePOD(POD):
         # XXX make sure path is subpath of self.path
         return path.open(mode).read()
 
+    def read_range(self, relpath, offset, length=None):
+        logger.debug("READ %s %s [%s:+%s]", self.path, relpath, offset, length)
+        path = self.path / relpath
+        with path.open("rb") as fh:
+            fh.seek(offset)
+            return fh.read(-1 if length is None else length)
+
+    def size(self, relpath):
+        return (self.path / relpath).stat().st_size
+
+    def mmap(self, relpath):
+        logger.debug("MMAP %s %s", self.path, relpath)
+        path = self.path / relpath
+        with path.open("rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size < max(settings.mmap_min_size, 1):
+                return fh.read()
+            return memoryview(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
     def write(self, relpath, data, mode="wb"):
-        if self.isfile(relpath):
+        path = self.path / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
             logger.debug("SKIP-WRITE %s %s", self.path, relpath)
             return
         logger.debug("WRITE %s %s", self.path, relpath)
+        # Write a temporary file and link it in place: readers never
+        # see partial content and linking fails if another writer
+        # already created the file
+        tmp = path.with_name(f".{path.name}.{uuid4().hex}")
+        try:
+            with tmp.open(mode) as fh:
+                res = fh.write(data)
+            os.link(tmp, path)
+        except FileExistsError:
+            logger.debug("SKIP-WRITE %s %s", self.path, relpath)
+            return
+        finally:
+            tmp.unlink(missing_ok=True)
+        return res
+
+    def replace(self, relpath, data):
+        logger.debug("REPLACE %s %s", self.path, relpath)
         path = self.path / relpath
         path.parent.mkdir(parents=True, exist_ok=True)
-        return path.open(mode).write(data)
+        tmp = path.with_name(f".{path.name}.{uuid4().hex}")
+        try:
+            with tmp.open("wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return len(data)
 
     def isdir(self, relpath):
         return self.path.joinpath(relpath).is_dir()
@@ -201,6 +333,8 @@ class FilePOD(POD):
 class MemPOD(POD):
 
     protocol = "memory"
+    # Not thread-safe (and not I/O bound)
+    workers = 1
 
     def __init__(self, path=".", parent=None):
         self.path = PurePosixPath(path)
@@ -246,7 +380,13 @@ class MemPOD(POD):
         pod = self._find_pod(fragments[:-1], auto_mkdir)
         return pod, fragments[-1]
 
-    def ls(self, relpath=".", missing_ok=False):
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
+        names = self._ls(relpath, missing_ok=missing_ok)
+        if start_after is not None:
+            return sorted(n for n in names if n > start_after)
+        return names
+
+    def _ls(self, relpath, missing_ok=False):
         logger.debug("LIST memory://%s %s", self.path, relpath)
         pod, leaf = self.find_parent_pod(relpath)
         # Handle pathological cases
@@ -288,6 +428,12 @@ class MemPOD(POD):
         pod.store[leaf] = data
         return len(data)
 
+    def replace(self, relpath, data):
+        pod, leaf = self.find_parent_pod(relpath, auto_mkdir=True)
+        logger.debug("REPLACE memory://%s %s", self.path, relpath)
+        pod.store[leaf] = data
+        return len(data)
+
     def isdir(self, relpath):
         pod, leaf = self.find_parent_pod(relpath)
         if pod is None:
@@ -331,51 +477,458 @@ class MemPOD(POD):
             del pod.store[leaf]
 
 
+class CacheIndex:
+    """
+    Keep track of the files cached by a CachePOD and of their size,
+    in least-recently-used order. The least recently used files are
+    removed when the total size goes over `max_size`. The index is
+    persisted in the local pod every `flush_every` changes (and on
+    `flush`), it is trusted on load. If it is missing, the local
+    pod is scanned and the cached files are removed.
+    """
+
+    filename = ".cache-index"
+    flush_every = 100
+
+    def __init__(self, pod, max_size):
+        self.pod = pod
+        self.max_size = max_size
+        self.entries = OrderedDict()  # path -> size
+        self.size = 0
+        self.lock = Lock()
+        self._changes = 0
+        self.load()
+
+    def load(self):
+        try:
+            entries = json.loads(self.pod.read(self.filename))
+        except FileNotFoundError:
+            self.rescan()
+            return
+        for path, size in entries:
+            self.entries[path] = size
+            self.size += size
+
+    def rescan(self):
+        # Without index, sizes and access order are unknown
+        try:
+            local = list(self.pod.walk())
+        except FileNotFoundError:
+            local = []
+        for path in local:
+            if segment_re.fullmatch(PurePosixPath(path).name):
+                logger.debug("EVICT %s", path)
+                self.pod.rm(path, missing_ok=True)
+        self.flush()
+
+    def flush(self):
+        with self.lock:
+            entries = [[path, size] for path, size in self.entries.items()]
+            self._changes = 0
+        self.pod.replace(self.filename, json.dumps(entries).encode())
+
+    def touch(self, path, size):
+        evicted = []
+        with self.lock:
+            if path in self.entries:
+                self.entries.move_to_end(path)
+            else:
+                self.entries[path] = size
+                self.size += size
+                self._changes += 1
+            while self.size > self.max_size and len(self.entries) > 1:
+                old_path, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                self._changes += 1
+                evicted.append(old_path)
+            flush = self._changes >= self.flush_every
+
+        for old_path in evicted:
+            logger.debug("EVICT %s", old_path)
+            self.pod.rm(old_path, missing_ok=True)
+        if flush:
+            self.flush()
+
+    def discard(self, path, recursive=False):
+        with self.lock:
+            if recursive:
+                prefix = "" if path == "." else path.rstrip("/") + "/"
+                paths = [p for p in self.entries if p.startswith(prefix)]
+            else:
+                paths = [path] if path in self.entries else []
+            for p in paths:
+                self.size -= self.entries.pop(p)
+                self._changes += 1
+
+
+class Listings:
+    """
+    Remote listings kept for `ttl` seconds. At most `size` listings
+    are kept (least recently used ones are evicted first), expired
+    ones are dropped on insertion. Listings are indexed by path, so
+    invalidation only looks at the ancestors of the modified path.
+    """
+
+    size = 1024
+
+    def __init__(self, ttl, size=None):
+        self.ttl = ttl
+        self.size = size or self.size
+        self.items = OrderedDict()  # (path, start_after) -> names, LRU order
+        self.born = OrderedDict()  # (path, start_after) -> timestamp
+        self.by_path = {}  # path -> set of keys
+        self.lock = Lock()
+
+    def get(self, path, start_after=None):
+        key = (path, start_after)
+        with self.lock:
+            born = self.born.get(key)
+            if born is None:
+                return None
+            if time() - born >= self.ttl:
+                self._drop(key)
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def set(self, path, start_after, names, now=None):
+        key = (path, start_after)
+        now = time() if now is None else now
+        with self.lock:
+            self._drop(key)
+            # Insertion order is also expiration order
+            while self.born:
+                oldest, born = next(iter(self.born.items()))
+                if now - born < self.ttl:
+                    break
+                self._drop(oldest)
+            while len(self.items) >= self.size:
+                self._drop(next(iter(self.items)))
+            self.items[key] = names
+            self.born[key] = now
+            self.by_path.setdefault(path, set()).add(key)
+
+    def invalidate(self, path, recursive=False):
+        """
+        Drop listings of `path` and of its ancestors (and of its
+        descendants if `recursive`)
+        """
+        path = PurePosixPath(path)
+        with self.lock:
+            paths = [str(p) for p in (path, *path.parents)]
+            if recursive:
+                paths.extend(
+                    p for p in self.by_path if path in PurePosixPath(p).parents
+                )
+            for p in paths:
+                for key in list(self.by_path.get(p, ())):
+                    self._drop(key)
+
+    def _drop(self, key):
+        if key not in self.born:
+            return
+        del self.items[key]
+        del self.born[key]
+        keys = self.by_path[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self.by_path[key[0]]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Uploader:
+    """
+    Upload payloads in background threads, with a bounded number of
+    pending uploads. Failed uploads are retried `retries` times,
+    `flush` waits for all pending uploads and raises the first error
+    encountered. Uploads that still failed are kept and submitted
+    again by the next `retry` (or `flush`).
+    """
+
+    retries = 3
+    backoff = 0.1
+
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(workers)
+        self.slots = BoundedSemaphore(workers * 4)
+        self.lock = Lock()
+        self.pending = set()
+        self.errors = []
+        self.failed = []  # List of (pod, relpath, data)
+
+    def submit(self, pod, relpath, data):
+        self.slots.acquire()
+        with self.lock:
+            fut = self.executor.submit(self._upload, pod, relpath, data)
+            self.pending.add(fut)
+        fut.add_done_callback(lambda fut: self._done(fut, pod, relpath, data))
+
+    def retry(self):
+        with self.lock:
+            failed, self.failed = self.failed, []
+        for pod, relpath, data in failed:
+            self.submit(pod, relpath, data)
+
+    def _upload(self, pod, relpath, data):
+        for attempt in range(self.retries + 1):
+            try:
+                return pod.write(relpath, data)
+            except Exception as exc:
+                if attempt == self.retries:
+                    raise
+                logger.warning("Upload of %s failed (%s), retrying", relpath, exc)
+                sleep(self.backoff * 2**attempt)
+
+    def _done(self, fut, pod, relpath, data):
+        with self.lock:
+            self.pending.discard(fut)
+            if fut.exception() is not None:
+                self.errors.append(fut.exception())
+                self.failed.append((pod, relpath, data))
+        self.slots.release()
+
+    def flush(self):
+        self.retry()
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+            if not pending:
+                break
+            for fut in pending:
+                fut.exception()  # Wait for it
+        with self.lock:
+            errors, self.errors = self.errors, []
+        if errors:
+            raise errors[0]
+
+
 class CachePOD(POD):
-    def __init__(self, local, remote):
+    """
+    Combine a local and a remote pod, reads are served from the local
+    pod when possible. If `max_size` is set, only content-addressed
+    files (segments) are cached, and the local pod is kept under
+    `max_size` bytes by evicting the least recently used files.
+
+    Remote listings are kept in memory for `ttl` seconds (disabled by
+    default), writes and deletions made through the pod invalidate
+    them.
+
+    With `write_behind`, segments are written locally and uploaded in
+    the background, other files (like revisions) are only written on
+    the remote once all pending uploads are done.
+    """
+
+    segment_re = segment_re
+    # Number of remote ranges kept in memory, and their total size
+    ranges_size = 1024
+    ranges_bytes = 64 * 1024 * 1024
+
+    def __init__(
+        self,
+        local,
+        remote,
+        max_size=None,
+        index=None,
+        prefix=".",
+        ttl=None,
+        listings=None,
+        write_behind=False,
+        uploader=None,
+        ranges=None,
+    ):
         self.local = local
         self.remote = remote
         self.protocol = f"{local.protocol}+{remote.protocol}"
+        if index is None and max_size is not None:
+            index = CacheIndex(local, max_size)
+        self.index = index
+        self.prefix = PurePosixPath(prefix)
+        self.ttl = ttl
+        # Cached remote listings, shared with sub-pods
+        if listings is None and ttl:
+            listings = Listings(ttl)
+        self.listings = listings
+        if uploader is None and write_behind:
+            uploader = Uploader(remote.max_workers)
+        self.uploader = uploader
+        # Byte ranges of segments not present locally (see read_range),
+        # shared with sub-pods
+        if ranges is None:
+            ranges = LRU(self.ranges_size, max_bytes=self.ranges_bytes)
+        self.ranges = ranges
         super().__init__()
 
     @property
     def path(self):
         return self.local.path
 
+    @property
+    def ranged(self):
+        return self.remote.ranged
+
+    @property
+    def max_workers(self):
+        return self.remote.max_workers
+
     def cd(self, *others):
         local = self.local.cd(*others)
         remote = self.remote.cd(*others)
-        return CachePOD(local, remote)
-
-    def ls(self, relpath=".", missing_ok=False):
-        return self.remote.ls(relpath, missing_ok=missing_ok)
+        prefix = self.prefix.joinpath(*others)
+        return CachePOD(
+            local,
+            remote,
+            index=self.index,
+            prefix=prefix,
+            ttl=self.ttl,
+            listings=self.listings,
+            uploader=self.uploader,
+            ranges=self.ranges,
+        )
+
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
+        if not self.ttl:
+            return self.remote.ls(
+                relpath, missing_ok=missing_ok, start_after=start_after
+            )
+        path = str(self.prefix / relpath)
+        names = self.listings.get(path, start_after)
+        if names is not None:
+            return list(names)
+        now = time()
+        names = self.remote.ls(relpath, missing_ok=missing_ok, start_after=start_after)
+        self.listings.set(path, start_after, names, now=now)
+        return list(names)
+
+    def _invalidate(self, relpath, recursive=False):
+        if self.listings is not None:
+            self.listings.invalidate(self.prefix / relpath, recursive=recursive)
+
+    def cacheable(self, relpath):
+        if self.index is None:
+            return True
+        return self.segment_re.fullmatch(PurePosixPath(relpath).name) is not None
+
+    def _touch(self, relpath, size):
+        if self.index is not None:
+            self.index.touch(str(self.prefix / relpath), size)
 
     def read(self, relpath, mode="rb"):
+        if not self.cacheable(relpath):
+            return self.remote.read(relpath, mode=mode)
         try:
-            return self.local.read(relpath, mode=mode)
+            data = self.local.read(relpath, mode=mode)
+        except FileNotFoundError:
+            data = self.remote.read(relpath, mode=mode)
+            self.local.write(relpath, data)
+        self._touch(relpath, len(data))
+        return data
+
+    def read_range(self, relpath, offset, length=None):
+        if not self.cacheable(relpath):
+            return self.remote.read_range(relpath, offset, length)
+        try:
+            return self.local.read_range(relpath, offset, length)
         except FileNotFoundError:
             pass
+        # Segments are immutable, so are their ranges
+        key = (str(self.prefix / relpath), offset, length)
+        data = self.ranges.get(key)
+        if data is None:
+            data = self.remote.read_range(relpath, offset, length)
+            self.ranges.set(key, data)
+        return data
+
+    def size(self, relpath):
+        if self.cacheable(relpath):
+            try:
+                return self.local.size(relpath)
+            except FileNotFoundError:
+                pass
+        return self.remote.size(relpath)
 
-        data = self.remote.read(relpath, mode=mode)
-        self.local.write(relpath, data)
+    def mmap(self, relpath):
+        if not self.cacheable(relpath):
+            return self.remote.read(relpath)
+        try:
+            data = self.local.mmap(relpath)
+        except FileNotFoundError:
+            return self.read(relpath)
+        self._touch(relpath, len(data))
         return data
 
+    def read_many(self, relpaths):
+        res = {}
+        missing = []
+        for relpath in relpaths:
+            if not self.cacheable(relpath):
+                missing.append(relpath)
+                continue
+            try:
+                res[relpath] = self.local.read(relpath)
+                self._touch(relpath, len(res[relpath]))
+            except FileNotFoundError:
+                missing.append(relpath)
+
+        for relpath, data in zip(missing, self.remote.read_many(missing)):
+            if self.cacheable(relpath):
+                self.local.write(relpath, data)
+                self._touch(relpath, len(data))
+            res[relpath] = data
+        return [res[relpath] for relpath in relpaths]
+
     def write(self, relpath, data, mode="wb"):
-        self.local.write(relpath, data, mode=mode)
-        return self.remote.write(relpath, data, mode=mode)
+        if self.uploader is not None:
+            if self.segment_re.fullmatch(PurePosixPath(relpath).name):
+                res = self.local.write(relpath, data, mode=mode)
+                self._touch(relpath, len(data))
+                # Upload even if the segment was already present
+                # locally (it may have been left by a failed upload),
+                # remote writes skip existing files
+                self.uploader.submit(self.remote, relpath, data)
+                if res is not None:
+                    self._invalidate(relpath)
+                return res
+            # Publish other files only after the segments
+            self.flush()
+
+        # Write remote first, so that segments found locally are known
+        # to exist on the remote too (see isfile)
+        res = self.remote.write(relpath, data, mode=mode)
+        self._invalidate(relpath)
+        if self.cacheable(relpath):
+            self.local.write(relpath, data, mode=mode)
+            self._touch(relpath, len(data))
+        return res
+
+    def flush(self):
+        if self.uploader is not None:
+            self.uploader.flush()
+        if self.index is not None and self.index._changes:
+            self.index.flush()
 
     def isdir(self, relpath):
         return self.remote.isdir(relpath)
 
     def isfile(self, relpath):
+        # Segments are immutable, no need to ask remote if we have them
+        name = PurePosixPath(relpath).name
+        if self.segment_re.fullmatch(name) and self.local.isfile(relpath):
+            return True
         return self.remote.isfile(relpath)
 
     def rm(self, relpath, recursive=False, missing_ok=False):
+        self.flush()
         self.remote.rm(relpath, recursive=recursive, missing_ok=missing_ok)
+        self._invalidate(relpath, recursive=recursive)
+        self.ranges.clear()
         try:
             self.local.rm(relpath, recursive=recursive, missing_ok=missing_ok)
         except FileNotFoundError:
             pass
+        if self.index is not None:
+            self.index.discard(str(self.prefix / relpath), recursive=recursive)
 
 
 class SSHPOD(POD):
@@ -407,15 +960,18 @@ class SSHPOD(POD):
         path = self.path.joinpath(*others)
         return SSHPOD(self.client, path)
 
-    def ls(self, relpath=".", missing_ok=False):
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
         logger.debug("LIST %s %s", self.path, relpath)
         path = self.path / relpath
         try:
-            return self.client.listdir(path)
+            names = self.client.listdir(path)
         except FileNotFoundError:
             if missing_ok:
                 return []
             raise
+        if start_after is not None:
+            return sorted(n for n in names if n > start_after)
+        return names
 
     def read(self, relpath, mode="rb"):
         logger.debug("READ %s %s", self.path, relpath)
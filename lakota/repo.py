@@ -263,7 +263,7 @@ class Repo:
         remote_cache = {r.label: r for r in remote.search()}
         if not labels:
             labels = remote_cache.keys()
-        with Pool() as pool:
+        with Pool(remote.pod) as pool:
             for label in labels:
                 logger.info("Sync collection: %s", label)
                 r_clct = remote_cache[label]
@@ -300,7 +300,7 @@ class Repo:
                 active_digests.update(clct.digests())
 
         base_folders = self.pod.ls()
-        with Pool() as pool:
+        with Pool(self.pod) as pool:
             for folder in base_folders:
                 pool.submit(self._gc_folder, folder, active_digests)
         count = sum(pool.results)
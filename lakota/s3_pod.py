@@ -1,10 +1,12 @@
+import asyncio
 from pathlib import Path
 
 import s3fs
 import urllib3
+from fsspec.asyn import sync
 
 from .pod import POD
-from .utils import logger
+from .utils import LRU, logger
 
 
 def silence_insecure_warning():
@@ -14,10 +16,18 @@ def silence_insecure_warning():
 class S3POD(POD):
 
     protocol = "s3"
-
-    def __init__(self, path, netloc=None, profile=None, verify=True, fs=None):
+    workers = 32
+    ranged = True
+    # Max number of paths remembered as written
+    known_size = 100_000
+
+    def __init__(
+        self, path, netloc=None, profile=None, verify=True, fs=None, known=None
+    ):
         # TODO document use of param: endpoint_url='http://127.0.0.1:5300'
         self.path = path
+        # Paths written (or skipped) by this pod and its sub-pods
+        self.known = LRU(self.known_size) if known is None else known
         if fs:
             self.fs = fs
         else:
@@ -37,11 +47,13 @@ class S3POD(POD):
 
     def cd(self, *others):
         path = self.path.joinpath(*others)
-        return S3POD(path, fs=self.fs)
+        return S3POD(path, fs=self.fs, known=self.known)
 
-    def ls(self, relpath=".", missing_ok=False):
+    def ls(self, relpath=".", missing_ok=False, start_after=None):
         logger.debug("LIST s3://%s %s", self.path, relpath)
         path = self.path / relpath
+        if start_after is not None:
+            return self._ls_after(path, start_after)
         try:
             return [Path(p).name for p in self.fs.ls(path)]
         except FileNotFoundError:
@@ -49,18 +61,82 @@ class S3POD(POD):
                 return []
             raise
 
+    def _ls_after(self, path, start_after):
+        # s3fs does not expose StartAfter, so we call the api directly
+        bucket, _, prefix = str(path).partition("/")
+        prefix = prefix.rstrip("/") + "/" if prefix else ""
+        params = {
+            "Bucket": bucket,
+            "Prefix": prefix,
+            "Delimiter": "/",
+            "StartAfter": prefix + start_after,
+        }
+        names = []
+        while True:
+            resp = self.fs.call_s3("list_objects_v2", **params)
+            names.extend(o["Key"][len(prefix) :] for o in resp.get("Contents", []))
+            names.extend(
+                p["Prefix"][len(prefix) :].rstrip("/")
+                for p in resp.get("CommonPrefixes", [])
+            )
+            if not resp.get("IsTruncated"):
+                return names
+            params["ContinuationToken"] = resp["NextContinuationToken"]
+
     def read(self, relpath, mode="rb"):
         logger.debug("READ s3://%s %s", self.path, relpath)
         path = str(self.path / relpath)
         return self.fs.open(path, mode).read()
 
+    def read_range(self, relpath, offset, length=None):
+        logger.debug("READ s3://%s %s [%s:+%s]", self.path, relpath, offset, length)
+        path = str(self.path / relpath)
+        end = None if length is None else offset + length
+        # Issue a GET with a Range header
+        return self.fs.cat_file(path, start=offset, end=end)
+
+    def size(self, relpath):
+        return self.fs.size(str(self.path / relpath))
+
+    def read_many(self, relpaths):
+        logger.debug("READ s3://%s (%s files)", self.path, len(relpaths))
+        paths = [str(self.path / relpath) for relpath in relpaths]
+        return sync(self.fs.loop, self._read_many, paths)
+
+    async def _read_many(self, paths):
+        # Use s3fs async api to run requests concurrently
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def read(path):
+            async with semaphore:
+                return await self.fs._cat_file(path)
+
+        return await asyncio.gather(*(read(p) for p in paths))
+
     def write(self, relpath, data, mode="wb"):
-        if self.isfile(relpath):
+        # Paths are content-addressed, so a path already written does
+        # not need to be written again
+        path = str(self.path / relpath)
+        if path in self.known:
             logger.debug("SKIP-WRITE s3://%s %s", self.path, relpath)
             return
         logger.debug("WRITE s3://%s %s", self.path, relpath)
-        path = str(self.path / relpath)
-        return self.fs.open(path, mode).write(data)
+        if isinstance(data, str):
+            data = data.encode()
+        bucket, _, key = path.partition("/")
+        try:
+            # Conditional write, the object is not overwritten if it
+            # already exists
+            self.fs.call_s3(
+                "put_object", Bucket=bucket, Key=key, Body=data, IfNoneMatch="*"
+            )
+        except FileExistsError:
+            logger.debug("SKIP-WRITE s3://%s %s", self.path, relpath)
+            self.known.set(path, True)
+            return
+        self.fs.invalidate_cache(path)
+        self.known.set(path, True)
+        return len(data)
 
     def isdir(self, relpath):
         return self.fs.isdir(self.path / relpath)
@@ -71,6 +147,10 @@ class S3POD(POD):
     def rm(self, relpath=".", recursive=False, missing_ok=False):
         logger.debug("REMOVE s3://%s %s", self.path, relpath)
         path = str(self.path / relpath)
+        if recursive:
+            self.known.clear()
+        else:
+            self.known.pop(path)
         try:
             return self.fs.rm(path, recursive=recursive)
         except FileNotFoundError:
@@ -1,8 +1,19 @@
 import shlex
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
+from itertools import accumulate
 
+import msgpack
 from numcodecs import registry
-from numpy import asarray, ascontiguousarray, dtype, frombuffer, issubdtype, ndarray
+from numpy import (
+    asarray,
+    ascontiguousarray,
+    concatenate,
+    dtype,
+    frombuffer,
+    issubdtype,
+    ndarray,
+)
 
 DTYPES = [dtype(s) for s in ("datetime64[s]", "int64", "float64", "U", "O")]
 
@@ -13,6 +24,9 @@ ALIASES = {
     "str": "U",
 }
 
+# Prefix of block payloads (see Codec.encode_blocks)
+block_magic = b"\x89LKBLOCK"
+
 __all__ = ["Schema"]
 
 
@@ -36,6 +50,10 @@ class Codec:
             if dt in (dtype("O"), dtype("U")):
                 default_codec_names = ["msgpack2", "zstd"]
             self.codec_names = default_codec_names
+        # "raw" means no codec, the array memory is stored as-is (and
+        # decoded without copy)
+        if "raw" in self.codec_names and dt in (dtype("O"), dtype("U")):
+            raise ValueError(f"Codec 'raw' not supported for type '{dt}'")
 
     def encode(self, arr):
         if len(arr) == 0:
@@ -46,15 +64,85 @@ class Codec:
         arr = arr.astype(self.dt)
         # Apply codecs
         for codec_name in self.codec_names:
+            if codec_name == "raw":
+                continue
             codec = registry.codec_registry[codec_name]
             arr = codec().encode(arr)
+        if isinstance(arr, ndarray):
+            return arr.tobytes()
         return arr
 
+    def encode_blocks(self, arr, block_size, bounds=False):
+        """
+        Split `arr` in blocks of `block_size` rows that are encoded
+        independently. The payload starts with `block_magic`, followed
+        by the size of a msgpack header and the header itself. The
+        header contains the row offsets (`rows`) and byte offsets
+        (`offsets`) of the blocks, and if `bounds` is true the (encoded)
+        min and max value of each block.
+        """
+        slices = [arr[i : i + block_size] for i in range(0, len(arr), block_size)]
+        blocks = [self.encode(s) for s in slices]
+        header = {
+            "rows": [i * block_size for i in range(len(blocks))] + [len(arr)],
+            "offsets": list(accumulate(map(len, blocks), initial=0)),
+        }
+        if bounds:
+            # ufuncs don't support str and object arrays
+            builtin = self.dt in (dtype("O"), dtype("U"))
+            mins = [min(s) if builtin else s.min() for s in slices]
+            maxs = [max(s) if builtin else s.max() for s in slices]
+            header["min"] = self.encode(asarray(mins, dtype=self.dt))
+            header["max"] = self.encode(asarray(maxs, dtype=self.dt))
+        head = msgpack.packb(header)
+        return b"".join([block_magic, len(head).to_bytes(4, "little"), head, *blocks])
+
+    @staticmethod
+    def read_header(data):
+        """
+        Return the header of block payload `data` and the position of
+        its first block
+        """
+        if bytes(data[: len(block_magic)]) != block_magic:
+            raise ValueError("Not a block payload")
+        pos = len(block_magic) + 4
+        size = int.from_bytes(data[len(block_magic) : pos], "little")
+        return msgpack.unpackb(data[pos : pos + size]), pos + size
+
+    def decode_rows(self, data, start=None, stop=None, blocks=False):
+        """
+        Return rows `start` to `stop` of payload `data`. If `blocks`
+        is true, `data` is a block payload (see `encode_blocks`) and
+        only the blocks containing those rows are decoded.
+        """
+        if not blocks:
+            return self.decode(data[:])[start:stop]
+        header, pos = self.read_header(data)
+        rows, offsets = header["rows"], header["offsets"]
+        start = 0 if start is None else start
+        stop = rows[-1] if stop is None else min(stop, rows[-1])
+        if start >= stop:
+            return asarray([], dtype=self.dt)
+        first = bisect_right(rows, start) - 1
+        last = bisect_left(rows, stop)
+        # Slice once the bytes of all the needed blocks (`data` can
+        # be a lazy payload, see `lakota.commit.LazyPayload`)
+        base = offsets[first]
+        view = memoryview(data[pos + base : pos + offsets[last]])
+        arrays = [
+            self.decode(view[offsets[i] - base : offsets[i + 1] - base])
+            for i in range(first, last)
+        ]
+        lo = rows[first]
+        return concatenate(arrays)[start - lo : stop - lo]
+
     def decode(self, arr):
         if len(arr) == 0:
             return asarray([], dtype=self.dt)
         # Apply all codecs
         for name in reversed(self.codec_names):
+            if name == "raw":
+                continue
             codec = registry.codec_registry[name]
             arr = codec().decode(arr)
         if self.dt in ("O", "U"):
@@ -1,10 +1,14 @@
+from collections import deque
+from itertools import islice
 from time import time
-from numpy import issubdtype
+
+from numpy import concatenate, issubdtype
 
 from .changelog import phi
-from .commit import Commit
+from .commit import Commit, Segment, array_stats
 from .frame import Frame
-from .utils import Interval, Pool, encoder, hashed_path, hexdigest, settings
+from .sexpr import AST
+from .utils import Interval, encoder, hashed_path, hexdigest, settings
 
 __all__ = ["Series", "KVSeries"]
 
@@ -104,30 +108,54 @@ class Series:
         # Make sure frame is sorted
         assert frame.is_sorted(), "Frame is not sorted!"
 
+        if start is not None or stop is not None:
+            # Rows outside of start-stop are never read, drop them so
+            # that the commit length matches the payload
+            lo, hi = frame.index_slice(
+                self.schema.deserialize(start),
+                self.schema.deserialize(stop),
+                closed="b",
+            )
+            frame = frame.slice(lo, hi)
+
         # Save segments
         all_dig = []
         arr_length = None
         embedded = {}
-        with Pool() as pool:
-            for name in self.schema:
-                arr = self.schema[name].cast(frame[name])
-                if arr_length is None:
-                    arr_length = len(arr)
-                elif len(arr) != arr_length:
-                    raise ValueError("Length mismatch")
-                data = self.schema[name].codec.encode(arr)
-                digest = hexdigest(data)
-                all_dig.append(digest)
-                if (
-                    len(data) < settings.embed_max_size
-                ):  # every small array gets embedded
-                    # Put small arrays aside
-                    embedded[digest] = data
-                    continue
-                folder, filename = hashed_path(digest)
-                # XXX move writing in Series.commit and handle situation where the commit gets to large?
-                # XXX keep it here for when a batch gets too large ?
-                pool.submit(self.pod.cd(folder).write, filename, data)
+        stats = {}
+        blocks = set()
+        items = []
+        for name in self.schema:
+            arr = self.schema[name].cast(frame[name])
+            if arr_length is None:
+                arr_length = len(arr)
+            elif len(arr) != arr_length:
+                raise ValueError("Length mismatch")
+            codec = self.schema[name].codec
+            in_blocks = settings.block_size and len(arr) > settings.block_size
+            if in_blocks:
+                # Block layout allows partial decoding of the column
+                data = codec.encode_blocks(
+                    arr, settings.block_size, bounds=self.schema[name].idx
+                )
+            else:
+                data = codec.encode(arr)
+            digest = hexdigest(data)
+            all_dig.append(digest)
+            if in_blocks:
+                blocks.add(digest)
+            arr_stats = array_stats(arr)
+            if arr_stats is not None:
+                stats[digest] = arr_stats
+            if len(data) < settings.embed_max_size:  # every small array gets embedded
+                # Put small arrays aside
+                embedded[digest] = data
+                continue
+            folder, filename = hashed_path(digest)
+            items.append((str(folder / filename), data))
+        # XXX move writing in Series.commit and handle situation where the commit gets to large?
+        # XXX keep it here for when a batch gets too large ?
+        self.pod.write_many(items)
 
         # Build commit info
         start = start or frame.start()  # XXX Use numpy.quantile ?
@@ -139,12 +167,40 @@ class Series:
 
         # Create new digest
         if batch:
-            ci_info = (self.label, start, stop, all_dig, len(frame), embedded)
+            ci_info = (
+                self.label,
+                start,
+                stop,
+                all_dig,
+                len(frame),
+                embedded,
+                stats,
+                blocks,
+            )
             batch.append(*ci_info)
             return
-        self.commit(start, stop, all_dig, len(frame), root=root, embedded=embedded)
+        self.commit(
+            start,
+            stop,
+            all_dig,
+            len(frame),
+            root=root,
+            embedded=embedded,
+            stats=stats,
+            blocks=blocks,
+        )
 
-    def commit(self, start, stop, all_dig, length, root=False, embedded=None):
+    def commit(
+        self,
+        start,
+        stop,
+        all_dig,
+        length,
+        root=False,
+        embedded=None,
+        stats=None,
+        blocks=None,
+    ):
         # root force commit on phi
         leaf_rev = None if root else self.changelog.leaf()
 
@@ -152,38 +208,75 @@ class Series:
         if leaf_rev:
             leaf_ci = leaf_rev.commit(self.collection)
             new_ci = leaf_ci.update(
-                self.label, start, stop, all_dig, length, embedded=embedded
+                self.label,
+                start,
+                stop,
+                all_dig,
+                length,
+                embedded=embedded,
+                stats=stats,
+                blocks=blocks,
             )
             # TODO early return if new_ci == leaf_ci
         else:
             new_ci = Commit.one(
-                self.schema, self.label, start, stop, all_dig, length, embedded=embedded
+                self.schema,
+                self.label,
+                start,
+                stop,
+                all_dig,
+                length,
+                embedded=embedded,
+                stats=stats,
+                blocks=blocks,
             )
 
         payload = new_ci.encode()
         parent = leaf_rev.child if leaf_rev else phi
         return self.changelog.commit(payload, parents=[parent])
 
+    def query(self, **kw):
+        return Query(self, **kw)
+
     def __getitem__(self, by):
-        return Query(self)[by]
+        return self.query()[by]
 
     def __matmul__(self, by):
-        return Query(self) @ by
+        return self.query() @ by
 
     def __len__(self):
-        return len(Query(self, select=list(self.schema.idx)))
+        return len(self.query(select=list(self.schema.idx)))
 
     def paginate(self, step=100_000, **kw):
-        return Query(self).paginate(step=step, **kw)
+        return self.query().paginate(step=step, **kw)
 
     def frame(self, **kw):
-        return Query(self, **kw).frame()
+        return self.query(**kw).frame()
 
     def df(self, **kw):
-        return Query(self, **kw).df()
+        return self.query(**kw).df()
+
+    def arrow(self, **kw):
+        return self.query(**kw).arrow()
+
+    def record_batches(self, step=100_000, **kw):
+        return self.query().record_batches(step=step, **kw)
 
 
 class Query:
+    """
+    Describe a read on a series. Supported parameters are `start`,
+    `stop`, `closed`, `before`, `select`, `limit`, `offset`, `mask`
+    and `reduce`. `mask` is an s-expression (like `(> self.value
+    1000)`) used to filter rows, segments whose stats (see
+    `lakota.commit.Commit`) prove that no row can match are not
+    read. `reduce` is a list of columns or expressions (or a dict
+    alias -> expression) passed to `Frame.reduce` on the result.
+    """
+
+    # Number of segments fetched together by paginate
+    prefetch = 8
+
     def __init__(self, series, **kw):
         self.series = series
         self.params = {
@@ -200,7 +293,7 @@ class Query:
         elif key in ("start", "stop"):
             self.params[key] = self.series.schema.deserialize(value)
         else:
-            if not key in ("limit", "offset", "before", "select"):
+            if not key in ("limit", "offset", "before", "select", "mask", "reduce"):
                 raise ValueError(f"Unsupported parameter: {key}")
             self.params[key] = value
 
@@ -217,15 +310,21 @@ class Query:
             return self
         params = self.params.copy()
         params.update(kw)
-        return Query(self.series, **params)
+        return self.__class__(self.series, **params)
 
     def segments(self):
         keys = ("start", "stop", "before", "closed")
         kw = {k: self.params.get(k) for k in keys}
         segments = self.series.segments(**kw)
+        mask = self.params.get("mask")
+        if mask and segments:
+            ast = AST.parse(mask)
+            segments = [sgm for sgm in segments if ast.may_match(sgm.stats)]
         return segments
 
     def __len__(self):
+        if self.params.get("mask"):
+            return len(self.frame())
         return sum(len(s) for s in self.segments())
 
     def frame(self, **kw):
@@ -234,37 +333,160 @@ class Query:
         limit = qr.params.get("limit")
         offset = qr.params.get("offset")
         select = qr.params.get("select")
-        return Frame.from_segments(
-            qr.series.schema,
-            segments,
-            limit=limit,
-            offset=offset,
-            select=select,
-        )
+        mask = qr.params.get("mask")
+        if mask:
+            # Filter rows first, limit and offset apply on the result
+            frm = Frame.from_segments(qr.series.schema, segments)
+            if len(frm) > 0:
+                frm = frm.mask(mask)
+            start = offset or 0
+            stop = None if limit is None else start + limit
+            frm = frm.slice(start, stop)
+            if select:
+                frm = frm.select(select)
+        else:
+            frm = Frame.from_segments(
+                qr.series.schema,
+                segments,
+                limit=limit,
+                offset=offset,
+                select=select,
+            )
+        return qr.reduce(frm)
+
+    def reduce(self, frm):
+        reduce = self.params.get("reduce")
+        if not reduce or frm.empty:
+            return frm
+        if isinstance(reduce, dict):
+            return frm.reduce(**reduce)
+        if isinstance(reduce, str):
+            reduce = [reduce]
+        return frm.reduce(*reduce)
 
     def df(self, **kw):
         frm = self.frame(**kw)
         return frm.df()
 
+    def arrow(self, **kw):
+        frm = self.frame(**kw)
+        return frm.to_arrow()
+
+    def record_batches(self, step=100_000, **kw):
+        """
+        Like `paginate` but yield arrow record batches
+        """
+        for frm in self.paginate(step=step, **kw):
+            yield from frm.to_arrow().to_batches()
+
     def paginate(self, step=100_000, **kw):
+        """
+        Yield frames of (at most) `step` rows. Segments are walked
+        once, only the ones feeding the current page are kept
+        decoded. When a mask is set, each page is filtered after being
+        read (so pages can be smaller than `step`, empty ones are
+        skipped) and `limit` and `offset` apply on the filtered rows
+        (like with `frame`). `reduce` is applied on each page.
+        """
         if step <= 0:
             raise ValueError("step argument must be > 0")
         qr = self @ kw
-        segments = qr.segments()
-        select = qr.params.get("select")
-        limit = qr.params.get("limit")
-        pos = qr.params.get("offset") or 0
-        while True:
-            lmt = step if limit is None else min(step, limit)
-            frm = Frame.from_segments(
-                qr.series.schema, segments, limit=lmt, offset=pos, select=select
-            )
-            if len(frm) == 0:
-                return
-            if limit is not None:
-                limit -= len(frm)
-            yield frm
-            pos += step
+        if not qr.params.get("mask"):
+            for frm in qr._cursor(step):
+                yield qr.reduce(frm)
+            return
+
+        # Filter rows first, limit and offset apply on the result
+        offset = qr.params.get("offset") or 0
+        remaining = qr.params.get("limit")
+        for frm in (qr @ {"offset": None, "limit": None})._cursor(step):
+            if remaining == 0:
+                break
+            if offset >= len(frm):
+                offset -= len(frm)
+                continue
+            stop = None if remaining is None else offset + remaining
+            frm = frm.slice(offset, stop)
+            offset = 0
+            if remaining is not None:
+                remaining -= len(frm)
+            yield qr.reduce(frm)
+
+    def _cursor(self, step):
+        # Yield pages of `step` rows (before filtering with mask)
+        schema = self.series.schema
+        segments = deque(self.segments())
+        select = self.params.get("select")
+        remaining = self.params.get("limit")
+        offset = self.params.get("offset") or 0
+        mask = self.params.get("mask")
+        if mask or not select:
+            # Read all columns, the mask can use any of them
+            names = list(schema)
+        else:
+            names = [n for n in schema if n in select]
+
+        chunks = []
+        buffered = 0
+        prefetched = 0
+        while segments and remaining != 0:
+            known = segments[0].length
+            if known is not None and offset >= known:
+                # Skip segment without fetching it
+                offset -= known
+                segments.popleft()
+                prefetched = max(prefetched - 1, 0)
+                continue
+            if not prefetched:
+                # Fetch payloads of the next few segments in one batch
+                window = list(islice(segments, self.prefetch))
+                Segment.prefetch(window, list(schema.idx) + names)
+                prefetched = len(window)
+            sgm = segments.popleft()
+            prefetched -= 1
+            size = len(sgm)
+            if offset >= size:
+                offset -= size
+                sgm.release()
+                continue
+            stop = size if remaining is None else min(size, offset + remaining)
+            pos = offset
+            offset = 0
+            while pos < stop:
+                take = min(step - buffered, stop - pos)
+                chunks.append({n: sgm.read(n, pos, pos + take) for n in names})
+                buffered += take
+                pos += take
+                if remaining is not None:
+                    remaining -= take
+                if buffered == step:
+                    frm = self._page(chunks, select if mask else None)
+                    chunks, buffered = [], 0
+                    if frm is not None:
+                        yield frm
+            sgm.release()
+
+        if chunks:
+            frm = self._page(chunks, select if mask else None)
+            if frm is not None:
+                yield frm
+
+    def _page(self, chunks, select=None):
+        # Assemble chunks into a frame and apply mask (returns None if
+        # the mask removes all rows)
+        if len(chunks) == 1:
+            columns = chunks[0]
+        else:
+            columns = {n: concatenate([c[n] for c in chunks]) for n in chunks[0]}
+        frm = Frame(self.series.schema, columns)
+        mask = self.params.get("mask")
+        if mask:
+            frm = frm.mask(mask)
+            if frm.empty:
+                return None
+            if select:
+                frm = frm.select(select)
+        return frm
 
 
 class KVSeries(Series):
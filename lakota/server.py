@@ -35,13 +35,43 @@ $ lakota -r memory://+s3:///bucket_name serve
 You can also use `file:////tmp/local-cache` instead of `memory://` to
 provide persistant caching.
 
+Segments are served with an `ETag` header and marked as immutable
+(their path is their digest), other files get an etag based on their
+content, so `lakota.http_pod.HttpPOD` (and any proxy in between) can
+cache them and use conditional requests. Listings are compressed with
+zstd when the client accepts it.
+
 **Beware**: no authentication nor encryption is provided, and the server
 expose full read and write access to the underlying repository.
 """
 
+import re
 from urllib.parse import urlsplit
 
+import msgpack
 from flask import Blueprint, Flask, Response, abort, request
+from numcodecs import registry
+
+from .http_repo import run_query
+from .utils import content_etag, hexdigest
+
+# Segments are content-addressed, clients (and proxies) can keep them
+# forever
+immutable = "public, max-age=31536000, immutable"
+range_re = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+def text_response(payload):
+    # Compress (non-empty) listings if the client supports it
+    if payload and "zstd" in request.headers.get("Accept-Encoding", ""):
+        zstd = registry.codec_registry["zstd"]()
+        return Response(
+            zstd.encode(payload.encode()),
+            mimetype="text/plain",
+            headers={"Content-Encoding": "zstd"},
+        )
+    return Response(payload, mimetype="text/plain")
+
 
 # Simple dict to register repositories
 dispatcher = {}
@@ -60,7 +90,8 @@ def pod(repo, action, relpath=None):
         schema:
           type: string
         required: true
-        description: Action to perform (ls, read, rm or walk)
+        description: Action to perform (ls, read, read_many, rm, write,
+          write_many, walk, query or len)
       - in: path
         name: relpath
         schema:
@@ -73,14 +104,65 @@ def pod(repo, action, relpath=None):
     if action == "ls":
         try:
             relpath = "." if relpath is None else relpath
-            payload = "\n".join(repo.pod.ls(relpath))
+            start_after = request.args.get("start_after")
+            payload = "\n".join(repo.pod.ls(relpath, start_after=start_after))
         except FileNotFoundError:
             return abort(404)
-        return Response(payload, mimetype="text/plain")
+        return text_response(payload)
 
     elif action == "read":
-        payload = repo.pod.read(relpath)
-        return Response(payload, mimetype="application/octet-stream")
+        etag = content_etag(relpath)
+        if_none_match = request.headers.get("If-None-Match")
+        if etag:
+            headers = {"ETag": etag, "Cache-Control": immutable}
+            if etag == if_none_match and repo.pod.isfile(relpath):
+                return Response(status=304, headers=headers)
+        else:
+            headers = {}
+
+        # Byte range (suffix ranges are not supported and return the
+        # full content)
+        match = range_re.match(request.headers.get("Range", ""))
+        if match:
+            first, last = match.groups()
+            first = int(first)
+            length = int(last) - first + 1 if last else None
+            try:
+                payload = repo.pod.read_range(relpath, first, length)
+            except FileNotFoundError:
+                return abort(404)
+            if not payload:
+                return abort(416)
+            headers["Content-Range"] = f"bytes {first}-{first + len(payload) - 1}/*"
+            return Response(
+                payload,
+                status=206,
+                mimetype="application/octet-stream",
+                headers=headers,
+            )
+
+        try:
+            payload = repo.pod.read(relpath)
+        except FileNotFoundError:
+            return abort(404)
+        if not etag:
+            # Other files can change, clients have to revalidate them
+            etag = f'"{hexdigest(payload)}"'
+            headers = {"ETag": etag, "Cache-Control": "no-cache"}
+            if etag == if_none_match:
+                return Response(status=304, headers=headers)
+        return Response(payload, mimetype="application/octet-stream", headers=headers)
+
+    elif action == "read_many":
+        # Body is a msgpack list of paths, response a msgpack list of
+        # payloads
+        relpaths = msgpack.unpackb(request.data)
+        try:
+            payloads = repo.pod.read_many(relpaths)
+        except FileNotFoundError:
+            return abort(404)
+        payload = msgpack.packb([bytes(p) for p in payloads])
+        return Response(payload, mimetype="application/msgpack")
 
     elif action == "rm":
         recursive = request.args.get("recursive", "").lower() == "true"
@@ -92,6 +174,13 @@ def pod(repo, action, relpath=None):
         info = repo.pod.write(relpath, request.data)
         return Response(str(info or ""), mimetype="text/plain")
 
+    elif action == "write_many":
+        # Body is a msgpack list of (path, payload) pairs, response a
+        # msgpack list of write results
+        items = msgpack.unpackb(request.data)
+        info = repo.pod.write_many(items)
+        return Response(msgpack.packb(info), mimetype="application/msgpack")
+
     elif action == "walk":
         pod = repo.pod
         if relpath:
@@ -100,7 +189,19 @@ def pod(repo, action, relpath=None):
         if max_depth is not None:
             max_depth = int(max_depth)
         payload = "\n".join(pod.walk(max_depth=max_depth))
-        return Response(payload, mimetype="text/plain")
+        return text_response(payload)
+
+    elif action in ("query", "len"):
+        # Body is a msgpack dict of query parameters (see
+        # lakota.http_repo), response the encoded result frame or
+        # number of rows
+        try:
+            payload = run_query(repo, msgpack.unpackb(request.data), action)
+        except FileNotFoundError:
+            return abort(404)
+        except ValueError as exc:
+            return abort(400, str(exc))
+        return Response(payload, mimetype="application/msgpack")
 
     else:
         return abort(404, f"Action {action} not supported")
@@ -50,7 +50,19 @@ import shlex
 from functools import reduce
 
 import numpy
-from numpy import bincount, inf, max, maximum, mean, min, minimum, quantile, repeat, sum
+from numpy import (
+    bincount,
+    datetime64,
+    inf,
+    max,
+    maximum,
+    mean,
+    min,
+    minimum,
+    quantile,
+    repeat,
+    sum,
+)
 
 __all__ = ["AST"]
 
@@ -242,6 +254,31 @@ def scan(tokens, end_tk=")"):
     return res
 
 
+# Mirror of each comparison operator (to swap operands)
+flipped = {"<": ">", "<=": ">=", "=": "=", "!=": "!=", ">=": "<=", ">": "<"}
+
+
+def bounds_match(op, value, lo, hi, nulls):
+    """
+    Tell if `x op value` can be true for some x between lo and hi
+    (nulls is the number of null values)
+    """
+    if isinstance(lo, datetime64) and isinstance(value, str):
+        value = datetime64(value)
+    if op == "<":
+        return lo < value
+    elif op == "<=":
+        return lo <= value
+    elif op == ">":
+        return hi > value
+    elif op == ">=":
+        return hi >= value
+    elif op == "=":
+        return lo <= value <= hi
+    # op is "!=", nan (and nat) are different from any value
+    return nulls > 0 or not (lo == value == hi)
+
+
 class AST:
     builtins = {
         "true": True,
@@ -308,6 +345,46 @@ class AST:
         fn = head.eval(env)
         return fn(*simple_args, **kw_args)
 
+    def may_match(self, stats, prefix="self."):
+        """
+        Return False if `stats` (a dict column -> (min, max, null
+        count)) proves that the expression is false for every row,
+        True otherwise. Only "and", "or" and comparisons between a
+        column and a literal are supported, any other expression "may
+        match".
+        """
+        if isinstance(self.tokens, Token) or not self.tokens:
+            return True
+        head, tail = self.tokens[0], self.tokens[1:]
+        if not isinstance(head, Token):
+            return True
+        if head.value == "and":
+            return all(AST(tk).may_match(stats, prefix) for tk in tail)
+        if head.value == "or":
+            return any(AST(tk).may_match(stats, prefix) for tk in tail)
+        if head.value not in flipped or len(tail) != 2:
+            return True
+        if not all(isinstance(tk, Token) for tk in tail):
+            return True
+
+        op = head.value
+        left, right = tail
+        if not left.value.startswith(prefix):
+            op = flipped[op]
+            left, right = right, left
+        name = left.value[len(prefix) :]
+        if not left.value.startswith(prefix) or name not in stats:
+            return True
+        value = right.as_number()
+        if value is None:
+            value = right.as_string()
+        if value is None:
+            return True
+        try:
+            return bool(bounds_match(op, value, *stats[name]))
+        except (TypeError, ValueError):
+            return True
+
     def is_aggregate(self):
         for tk in self.tokens:
             if isinstance(tk, Token):
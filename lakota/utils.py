@@ -1,7 +1,8 @@
 import bisect
 import logging
+import re
 import sys
-from collections import deque
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass
@@ -10,12 +11,15 @@ from enum import Flag
 from hashlib import sha1
 from itertools import islice
 from pathlib import PurePosixPath
+from threading import Lock, local
 from time import perf_counter, time
 
 from numpy import arange
 
 default_hash = sha1
 hexhash_len = 40
+# Segment files names are the end of their digest (see hashed_path)
+segment_re = re.compile(f"[0-9a-f]{{{hexhash_len - 4}}}")
 head = lambda it, n=1: list(islice(it, 0, n))
 tail = lambda it, n=1: deque(it, maxlen=n)
 skip = lambda it, n: list(islice(it, n, None))
@@ -33,9 +37,24 @@ class Settings:
     debug: bool
     verify_ssl: bool
     embed_max_size: int
-
-
-settings = Settings(threaded=True, verify_ssl=True, debug=False, embed_max_size=1024)
+    commit_cache_size: int
+    commit_cache_bytes: int  # Max size of the cached commit payloads
+    workers: dict  # Per-protocol number of threads, overrides POD.workers
+    mmap_min_size: int  # FilePOD.mmap falls back on plain reads below it
+    block_size: int  # Rows per block in segment payloads (0 disables blocks)
+
+
+settings = Settings(
+    threaded=True,
+    verify_ssl=True,
+    debug=False,
+    embed_max_size=1024,
+    commit_cache_size=128,
+    commit_cache_bytes=256 * 1024 * 1024,
+    workers={},
+    mmap_min_size=1024 * 1024,
+    block_size=0,
+)
 
 
 def chunky(collection, size=100):
@@ -96,6 +115,17 @@ def hashed_path(digest, depth=2):
     return folder, digest
 
 
+def content_etag(relpath):
+    """
+    Return an etag for `relpath` if it points to a segment file (those
+    are content-addressed, so immutable), None otherwise
+    """
+    path = PurePosixPath(relpath)
+    if not segment_re.fullmatch(path.name):
+        return None
+    return '"' + "".join(path.parts[-3:]) + '"'
+
+
 def pretty_nb(number):
     prefixes = "yzafpnum_kMGTPEZY"
     factors = [1000 ** i for i in range(-8, 8)]
@@ -131,28 +161,137 @@ def memoize(fn):
     return wrapper
 
 
+class LRU:
+    """
+    Thread-safe, size-bounded mapping that evicts least recently used
+    items, `hits` and `misses` count the outcome of `get` calls. If
+    `max_bytes` is set, the total weight of the values (as computed
+    by `weigh`) is also kept under it.
+    """
+
+    def __init__(self, size, max_bytes=None, weigh=len):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self._discard(key)
+            self._items[key] = value
+            if self.max_bytes is not None:
+                self.nbytes += self.weigh(value)
+            self._evict()
+
+    def resize(self, size, max_bytes=None):
+        """
+        Change the bounds of the mapping, evicting items if needed
+        """
+        with self._lock:
+            if max_bytes is not None and self.max_bytes is None:
+                # Weights were not tracked so far
+                self.nbytes = sum(map(self.weigh, self._items.values()))
+            self.size = size
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while len(self._items) > self.size or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            self._discard(next(iter(self._items)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            return self._discard(key)
+
+    def _discard(self, key):
+        value = self._items.pop(key)
+        if self.max_bytes is not None:
+            self.nbytes -= self.weigh(value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+            self.hits = self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
 class Pool:
     """
-    Threadpoolexecutor wrapper to simplify it's usage
+    Threadpoolexecutor wrapper to simplify it's usage. One executor is
+    created per pod protocol, sized after `POD.max_workers`. Nested
+    usage (a function running in a pool that submits other functions)
+    is run inline to avoid deadlocks.
     """
 
-    _pool = ThreadPoolExecutor(4)
+    default_workers = 4
+    _executors = {}
+    _lock = Lock()
+    _local = local()
 
-    def __init__(self):
+    def __init__(self, pod=None):
         self.futures = []
         self.results = []
+        if pod is None:
+            self.key, self.workers = None, self.default_workers
+        else:
+            self.key, self.workers = pod.protocol, pod.max_workers
+        self.inline = (
+            not settings.threaded
+            or self.workers < 2
+            or getattr(self._local, "nested", False)
+        )
 
     def __enter__(self):
         return self
 
+    def executor(self):
+        key = (self.key, self.workers)
+        with self._lock:
+            if key not in self._executors:
+                self._executors[key] = ThreadPoolExecutor(self.workers)
+            return self._executors[key]
+
+    @classmethod
+    def run(cls, fn, *a, **kw):
+        cls._local.nested = True
+        try:
+            return fn(*a, **kw)
+        finally:
+            cls._local.nested = False
+
     def submit(self, fn, *a, **kw):
-        if settings.threaded:
-            self.futures.append(self._pool.submit(fn, *a, **kw))
-        else:
+        if self.inline:
             self.results.append(fn(*a, **kw))
+        else:
+            self.futures.append(self.executor().submit(self.run, fn, *a, **kw))
 
     def __exit__(self, type, value, traceback):
-        if settings.threaded:
+        if not self.inline:
             self.results = [fut.result() for fut in self.futures]
 
 
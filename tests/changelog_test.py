@@ -1,10 +1,10 @@
 import time
 from concurrent.futures import ThreadPoolExecutor
 
-from lakota import Changelog
-from lakota.changelog import Revision, phi
+from lakota import Changelog, Repo, Schema
+from lakota.changelog import Revision, commit_cache, phi
 from lakota.pod import MemPOD
-from lakota.utils import hexdigest
+from lakota.utils import hexdigest, settings
 
 datum = b"ham spam foo bar baz".split()
 
@@ -108,3 +108,56 @@ def test_leafs():
 
     # Last writes wins
     assert changelog.leaf().read() == b"bar"
+
+
+def test_commit_cache():
+    schema = Schema(["timestamp int*", "value float"])
+    clct = Repo().create_collection(schema, "temperature")
+    for label in ("Brussels", "Paris"):
+        (clct / label).write({"timestamp": [1, 2, 3], "value": [1, 2, 3]})
+
+    commit_cache.clear()
+    for label in ("Brussels", "Paris"):
+        assert len((clct / label).frame()) == 3
+    # Leaf commit is decoded only once
+    assert commit_cache.misses == 1
+    assert commit_cache.hits == 1
+
+
+def test_commit_cache_bytes(monkeypatch):
+    schema = Schema(["timestamp int*", "value float"])
+    clct = Repo().create_collection(schema, "temperature")
+    (clct / "Brussels").write({"timestamp": [1, 2, 3], "value": [1, 2, 3]})
+    payload = clct.changelog.leaf().read()
+
+    commit_cache.clear()
+    clct.series("Brussels").frame()
+    assert commit_cache.nbytes == len(payload)
+    # Cache follows the settings, commits larger than the limit are
+    # not kept
+    monkeypatch.setattr(settings, "commit_cache_bytes", len(payload) - 1)
+    clct.series("Brussels").frame()
+    assert len(commit_cache) == 0
+    clct.series("Brussels").frame()
+    assert commit_cache.hits == 0
+
+
+def test_incremental_refresh():
+    pod = MemPOD("/")
+    changelog = Changelog(pod)
+    other = Changelog(pod)
+    populate(changelog, datum[:3])
+    assert len(other.log()) == 3
+
+    # Writes from another changelog are appended on refresh
+    populate(changelog, datum[3:])
+    other.refresh()
+    assert [r.path for r in other.log()] == [r.path for r in changelog.log()]
+    assert other.leaf().path == changelog.leaf().path
+
+    # Revisions based on an old parent need a full refresh
+    (rev,) = changelog.commit(b"root", parents=[phi])
+    other.refresh()
+    assert len(other.log()) == len(datum)
+    other.refresh(full=True)
+    assert len(other.log()) == len(datum) + 1
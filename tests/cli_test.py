@@ -0,0 +1,82 @@
+import io
+import sys
+
+import pytest
+
+from lakota import Repo, Schema
+from lakota.cli import run
+
+schema = Schema(["timestamp int*", "value float"])
+
+
+def lakota(monkeypatch, repo_uri, *args, stdin=""):
+    monkeypatch.setattr(sys, "argv", ["lakota", "-r", repo_uri, *args])
+    monkeypatch.setattr(sys, "stdin", io.StringIO(stdin))
+    run()
+
+
+@pytest.fixture
+def repo_uri(tmp_path):
+    uri = f"file:///{tmp_path}"
+    Repo(uri).create_collection(schema, "temperature")
+    return uri
+
+
+def test_write_chunks(repo_uri, monkeypatch):
+    lines = "".join(f"{i},{i / 2}\n" for i in range(2_500))
+    lakota(
+        monkeypatch,
+        repo_uri,
+        "write",
+        "temperature/brussels",
+        "--create",
+        "--chunk-size",
+        "1000",
+        stdin=lines,
+    )
+    clct = Repo(repo_uri) / "temperature"
+    # All the chunks are committed together
+    assert len(list(clct.changelog)) == 1
+    frm = (clct / "brussels").frame()
+    assert len(frm) == 2_500
+    assert list(frm["timestamp"]) == list(range(2_500))
+    assert list(frm["value"]) == [i / 2 for i in range(2_500)]
+
+
+def test_write_create(repo_uri, monkeypatch):
+    # Unknown series are only written with --create
+    with pytest.raises(SystemExit):
+        lakota(monkeypatch, repo_uri, "write", "temperature/paris", stdin="1,1\n")
+    assert (Repo(repo_uri) / "temperature").ls() == []
+
+    lakota(
+        monkeypatch, repo_uri, "write", "temperature/paris", "--create", stdin="1,1\n"
+    )
+    frm = (Repo(repo_uri) / "temperature" / "paris").frame()
+    assert list(frm["timestamp"]) == [1]
+    assert list(frm["value"]) == [1.0]
+
+
+@pytest.mark.parametrize("fmt", ["csv", "arrow", "parquet"])
+def test_export_import(repo_uri, tmp_path, monkeypatch, fmt):
+    if fmt != "csv":
+        pytest.importorskip("pyarrow")
+    clct = Repo(repo_uri) / "temperature"
+    frames = {
+        "brussels": {"timestamp": range(1_000), "value": [i / 2 for i in range(1_000)]},
+        "paris": {"timestamp": [1, 2, 3], "value": [1.5, 2.5, 3.5]},
+    }
+    for label, frm in frames.items():
+        (clct / label).write(frm)
+
+    dump = f"file:///{tmp_path / 'dump'}"
+    lakota(monkeypatch, repo_uri, "export", dump, "--format", fmt)
+
+    other_uri = f"file:///{tmp_path / 'other'}"
+    other = Repo(other_uri).create_collection(schema, "temperature")
+    lakota(monkeypatch, other_uri, "import", dump)
+    assert other.ls() == ["brussels", "paris"]
+    for label, frm in frames.items():
+        res = (other / label).frame()
+        assert list(res["timestamp"]) == list(frm["timestamp"])
+        assert list(res["value"]) == list(frm["value"])
@@ -2,9 +2,12 @@ from time import sleep
 
 import pytest
 from numpy import arange
+from numpy.random import random
 
+from lakota.pod import FilePOD
 from lakota.changelog import phi
 from lakota.repo import Repo, Schema
+from lakota.utils import hashed_path, settings
 
 schema = Schema(["timestamp timestamp*", "value float"])
 frame = {"timestamp": [1, 2, 3], "value": [11, 12, 13]}
@@ -144,3 +147,102 @@ def test_delete():
 
     srs = temperature / "Brussels"
     assert len(srs.frame()) == 0
+
+
+def test_label_index():
+    repo = Repo()
+    temperature = repo.create_collection(schema, "temperature")
+    for label in ("Paris", "Brussels", "Berlin"):
+        srs = temperature / label
+        srs.write(frame)
+        srs.write({"timestamp": [4, 5], "value": [14, 15]})
+
+    ci = temperature.changelog.leaf().commit(temperature)
+    assert list(ci.label_index) == ["Berlin", "Brussels", "Paris"]
+    assert ci.label_range("Brussels") == (2, 4)
+    # Missing labels give their insertion point
+    assert ci.label_range("Amsterdam") == (0, 0)
+    assert ci.label_range("Madrid") == (4, 4)
+    assert ci.label_range("Rome") == (6, 6)
+
+    assert temperature.ls() == ["Berlin", "Brussels", "Paris"]
+    for label in temperature:
+        assert all((temperature / label).frame()["value"] == [11, 12, 13, 14, 15])
+
+
+def test_batch():
+    repo = Repo()
+    temperature = repo.create_collection(schema, "temperature")
+    (temperature / "Brussels").write(frame)
+
+    labels = ["Paris", "Brussels", "Berlin", "Paris"]
+    with temperature.batch() as batch:
+        for pos, label in enumerate(labels):
+            frm = {"timestamp": [2 + pos, 3 + pos], "value": [pos, pos]}
+            (temperature / label).write(frm, batch=batch)
+
+    assert len(batch.revs) == 1
+    assert temperature.ls() == ["Berlin", "Brussels", "Paris"]
+    brussels = (temperature / "Brussels").frame()
+    assert all(brussels["value"] == [11, 12, 1, 1])
+    # Updates on the same label are applied in order
+    paris = (temperature / "Paris").frame()
+    assert all(paris["value"] == [0, 0, 3, 3])
+
+
+@pytest.mark.parametrize("ranged", [True, False])
+def test_repack(ranged, tmp_path, monkeypatch):
+    repo = Repo(f"file:///{tmp_path}")
+    temperature = repo.create_collection(schema, "temperature")
+    assert temperature.repack() == []
+    if ranged:
+        # Packed block payloads are read lazily
+        monkeypatch.setattr(FilePOD, "ranged", True)
+        monkeypatch.setattr(settings, "block_size", 100)
+
+    frames = {}
+    for pos, label in enumerate(["Brussels", "Paris", "Berlin"]):
+        frm = {
+            "timestamp": arange(1000) + pos * 1000,
+            "value": random(1000),
+        }
+        temperature.series(label).write(frm)
+        frames[label] = frm
+    # Overwrite Brussels, to get something to drop
+    frames["Brussels"]["value"] = frames["Brussels"]["value"] * 2
+    temperature.series("Brussels").write(frames["Brussels"])
+    assert len(list(temperature.changelog)) == 4
+
+    # Small pack size, to get several packs
+    (rev,) = temperature.repack(pack_size=10_000)
+    assert rev.parent == phi
+    assert len(list(temperature.changelog)) == 1
+    ci = rev.commit(temperature)
+    packs = {p for p, _, _ in ci.packed.values()}
+    assert 1 < len(packs) < len(ci.packed)
+    # Nothing left to pack
+    assert temperature.repack() == []
+
+    # Loose files are removed by gc, packs are kept
+    assert repo.gc() > 0
+    for dig in ci.packed:
+        folder, filename = hashed_path(dig)
+        assert repo.pod.cd(folder).isfile(filename) == (dig in packs)
+    assert bool(ci.blocks) == ranged
+    for label, frm in frames.items():
+        assert temperature.series(label).frame() == frm
+        res = temperature.series(label).frame(start=frm["timestamp"][500])
+        assert res == {k: v[500:] for k, v in frm.items()}
+
+    # New writes are stored as loose files next to the packs
+    frm = {"timestamp": arange(1000) + 3000, "value": random(1000)}
+    temperature.series("London").write(frm)
+    assert repo.gc() == 0
+    assert temperature.series("London").frame() == frm
+    assert temperature.series("Paris").frame() == frames["Paris"]
+
+    # Pull copies packs
+    other = Repo()
+    other.pull(repo)
+    for label, frm in frames.items():
+        assert other.collection("temperature").series(label).frame() == frm
@@ -0,0 +1,110 @@
+from numcodecs import registry
+from numpy import asarray
+
+from lakota import Schema
+from lakota.commit import Commit
+from lakota.utils import hexdigest
+
+schema = Schema(["timestamp int*", "value float"])
+
+
+def make_commit():
+    ci = Commit.empty(schema)
+    for pos, label in enumerate(["b", "a", "c", "a"]):
+        digests = [hexdigest(f"{label}-{pos}-{name}".encode()) for name in schema]
+        ci = ci.update(label, (pos,), (pos + 10,), digests, 11)
+    return ci
+
+
+def encode_v1(ci):
+    # Commit encoding as done by earlier versions of lakota
+    data = {
+        "start": {"timestamp": schema["timestamp"].codec.encode(ci.start["timestamp"])},
+        "stop": {"timestamp": schema["timestamp"].codec.encode(ci.stop["timestamp"])},
+        "digest": {n: Commit.digest_codec.encode(ci.digest[n]) for n in schema},
+        "length": Commit.len_codec.encode(ci.length),
+        "closed": Commit.closed_codec.encode(ci.closed),
+        "label": Commit.label_codec.encode(ci.label),
+        "embedded": {},
+    }
+    return registry.codec_registry["msgpack2"]().encode([data])
+
+
+def check_equal(ci, other):
+    assert all(ci.label == other.label)
+    assert all(ci.length == other.length)
+    assert all(ci.closed == other.closed)
+    for name in schema:
+        assert all(ci.digest[name] == other.digest[name])
+    for name in schema.idx:
+        assert all(ci.start[name] == other.start[name])
+        assert all(ci.stop[name] == other.stop[name])
+
+
+def test_encode_decode():
+    ci = make_commit()
+    assert list(ci.label) == ["a", "a", "b", "c"]
+    assert list(ci.closed) == ["l", "b", "b", "b"]
+    payload = ci.encode()
+    check_equal(ci, Commit.decode(schema, payload))
+
+    # Binary digests are smaller than the original format
+    assert len(payload) < len(encode_v1(ci))
+
+    # Empty commit
+    empty = Commit.decode(schema, Commit.empty(schema).encode())
+    assert len(empty) == 0
+
+
+def test_decode_v1():
+    ci = make_commit()
+    check_equal(ci, Commit.decode(schema, encode_v1(ci)))
+
+
+def test_stats():
+    ci = make_commit()
+    ci.stats = {d: (1, 2, 0) for d in ci.digest["timestamp"]}
+    ci.stats.update({d: (1.5, 2.5, 3) for d in ci.digest["value"]})
+    ci.stats["unknown"] = (0, 0, 0)
+    res = Commit.decode(schema, ci.encode())
+    check_equal(ci, res)
+    # Stats of digests not referenced by the commit are not kept
+    assert res.stats == {d: s for d, s in ci.stats.items() if d != "unknown"}
+
+    # Stats are carried by updates
+    digests = [hexdigest(f"new-{name}".encode()) for name in schema]
+    res = res.update("a", (0,), (5,), digests, 6, stats={digests[1]: (0.0, 1.0, 0)})
+    assert res.stats[digests[1]] == (0.0, 1.0, 0)
+    assert all(d in res.stats for d in res.digest["value"])
+
+
+def test_packed():
+    ci = make_commit()
+    digests = list(ci.digest["value"])
+    ci.packed = {d: (hexdigest(b"pack"), pos * 10, 10) for pos, d in enumerate(digests)}
+    ci.packed["unknown"] = (hexdigest(b"pack"), 0, 0)
+    res = Commit.decode(schema, ci.encode())
+    check_equal(ci, res)
+    # Only referenced digests are kept in the pack index
+    assert res.packed == {d: p for d, p in ci.packed.items() if d != "unknown"}
+
+    # Pack index is carried by updates and slices
+    res = res.update("d", (0,), (5,), [hexdigest(b"x"), hexdigest(b"y")], 6)
+    assert all(d in res.packed for d in digests)
+    assert res.slice(0, 1).packed == res.packed
+
+
+def test_blocks():
+    ci = make_commit()
+    digests = list(ci.digest["value"])
+    ci.blocks = set(digests) | {"unknown"}
+    res = Commit.decode(schema, ci.encode())
+    check_equal(ci, res)
+    # Only referenced digests are kept
+    assert res.blocks == set(digests)
+
+    # Block digests are carried by updates and slices
+    new = [hexdigest(b"x"), hexdigest(b"y")]
+    res = res.update("d", (0,), (5,), new, 6, blocks={new[1]})
+    assert res.blocks == {*digests, new[1]}
+    assert res.slice(0, 1).blocks == res.blocks
@@ -205,3 +205,25 @@ def test_df_conversion():
     frm = Frame(base_schema, df)
     for col in frm:
         assert all(frm.df()[col] == df[col])
+
+
+def test_arrow_conversion():
+    pytest.importorskip("pyarrow")
+    schema = Schema(["timestamp timestamp*", "value float", "category str"])
+    frm = Frame(
+        schema,
+        {
+            "timestamp": ["2020-01-01", "2020-01-02"],
+            "value": VALUES[:2],
+            "category": NAMES[:2],
+        },
+    )
+    tbl = frm.to_arrow()
+    assert tbl.column_names == ["timestamp", "value", "category"]
+    frm2 = Frame.from_arrow(schema, tbl)
+    assert frm2 == frm
+    # Numerical columns are not copied
+    assert frm2["value"].base is not None
+
+    for batch in tbl.to_batches():
+        assert Frame.from_arrow(schema, batch) == frm
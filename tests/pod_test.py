@@ -1,7 +1,13 @@
+import os
+from pathlib import PurePosixPath
+from time import time
+
 import pytest
 
 from lakota import POD
-from lakota.pod import FilePOD, MemPOD
+from lakota.pod import CachePOD, FilePOD, Listings, MemPOD
+from lakota.s3_pod import S3POD
+from lakota.utils import hashed_path, hexdigest, settings
 
 
 def test_cd(pod):
@@ -35,6 +41,62 @@ def test_multi_write(pod):
     assert res is None
 
 
+def test_write_no_overwrite(pod):
+    pod.write("key", b"ham")
+    assert pod.write("key", b"spam") is None
+    assert pod.read("key") == b"ham"
+    # Write is possible after a delete
+    pod.rm("key")
+    assert pod.write("key", b"spam") == 4
+    assert pod.read("key") == b"spam"
+
+
+def test_file_pod_write_race(tmp_path, monkeypatch):
+    pod = FilePOD(tmp_path)
+    link = os.link
+
+    def racy_link(src, dst):
+        # Another writer creates the file first
+        with open(dst, "wb") as fh:
+            fh.write(b"other")
+        link(src, dst)
+
+    monkeypatch.setattr(os, "link", racy_link)
+    assert pod.write("key", b"mine") is None
+    assert pod.read("key") == b"other"
+    # No temporary file left behind
+    assert pod.ls() == ["key"]
+
+
+def test_s3_pod_conditional_write():
+    class FakeS3:
+        # Mimic s3fs, a failed If-None-Match condition is translated
+        # to FileExistsError
+        def __init__(self):
+            self.store = {}
+
+        def call_s3(self, method, Bucket, Key, Body, IfNoneMatch):
+            assert method == "put_object" and IfNoneMatch == "*"
+            if (Bucket, Key) in self.store:
+                raise FileExistsError(Key)
+            self.store[Bucket, Key] = Body
+
+        def invalidate_cache(self, path):
+            pass
+
+    # Two pods sharing the bucket but not their known paths
+    fs = FakeS3()
+    pod = S3POD(PurePosixPath("bucket"), fs=fs)
+    other = S3POD(PurePosixPath("bucket"), fs=fs)
+    assert pod.write("key", b"ham") == 3
+    assert other.write("key", b"spam") is None
+    assert fs.store["bucket", "key"] == b"ham"
+    # Skipped path is now known, no further request is made
+    fs.store.clear()
+    assert other.write("key", b"spam") is None
+    assert fs.store == {}
+
+
 def test_write_delete(pod):
     data = bytes.fromhex("DEADBEEF")
 
@@ -92,3 +154,296 @@ def test_walk(pod):
     assert sorted(pod.walk(max_depth=2)) == ["bar/baz", "qux"]
     assert sorted(pod.walk(max_depth=1)) == ["qux"]
     assert sorted(pod.walk(max_depth=0)) == []
+
+
+def test_ls_start_after(pod):
+    data = b""
+    for name in ("a.b", "b.c", "c.d", "sub/e"):
+        pod.write(name, data)
+    assert pod.ls(start_after="b") == ["b.c", "c.d", "sub"]
+    assert pod.ls(start_after="b.c") == ["c.d", "sub"]
+    assert pod.ls(start_after="z") == []
+
+
+def test_read_many(pod):
+    payloads = {f"ham/{i}": bytes([i]) * i for i in range(1, 5)}
+    for key, data in payloads.items():
+        pod.write(key, data)
+    keys = list(reversed(payloads))
+    assert pod.read_many(keys) == [payloads[k] for k in keys]
+    assert pod.read_many([]) == []
+
+    with pytest.raises(FileNotFoundError):
+        pod.read_many(["ham/1", "spam"])
+
+
+def test_mmap(pod, monkeypatch):
+    small = b"ham"
+    large = bytes(range(256)) * 10
+    pod.write("small", small)
+    pod.write("large", large)
+    monkeypatch.setattr(settings, "mmap_min_size", len(large))
+    assert bytes(pod.mmap("small")) == small
+    assert bytes(pod.mmap("large")) == large
+
+    with pytest.raises(FileNotFoundError):
+        pod.mmap("spam")
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="Needs procfs")
+def test_read_many_fds(tmp_path, monkeypatch):
+    # Bulk reads do not keep one file descriptor per file
+    pod = POD.from_uri(f"file:///{tmp_path}")
+    monkeypatch.setattr(settings, "mmap_min_size", 1)
+    keys = [f"ham/{i}" for i in range(50)]
+    for key in keys:
+        pod.write(key, b"spam" * 100)
+    before = len(os.listdir("/proc/self/fd"))
+    res = pod.read_many(keys)
+    assert len(os.listdir("/proc/self/fd")) <= before
+    assert all(bytes(data) == b"spam" * 100 for data in res)
+
+
+def test_read_range(pod):
+    data = bytes(range(256))
+    pod.write("ham/spam", data)
+    assert pod.read_range("ham/spam", 0, 10) == data[:10]
+    assert pod.read_range("ham/spam", 250) == data[250:]
+    assert pod.read_range("ham/spam", 100, 50) == data[100:150]
+    assert pod.cd("ham").read_range("spam", 200, 100) == data[200:]
+
+    with pytest.raises(FileNotFoundError):
+        pod.read_range("spam", 0, 10)
+
+
+def test_size(pod):
+    pod.write("ham/spam", b"spam" * 10)
+    assert pod.size("ham/spam") == 40
+    assert pod.cd("ham").size("spam") == 40
+    with pytest.raises(FileNotFoundError):
+        pod.size("spam")
+
+
+def test_cache_pod_ranges(tmp_path, monkeypatch):
+    local, remote = FilePOD(tmp_path), MemPOD(".")
+    pod = CachePOD(local, remote, max_size=1000)
+    folder, filename = hashed_path(hexdigest(b"ham"))
+    remote.cd(folder).write(filename, bytes(range(100)))
+    calls = []
+    read_range = MemPOD.read_range
+    monkeypatch.setattr(
+        MemPOD, "read_range", lambda *a: calls.append(a[1:]) or read_range(*a)
+    )
+
+    # Ranges of remote segments are cached
+    sub = pod.cd(folder)
+    assert sub.read_range(filename, 10, 5) == bytes(range(10, 15))
+    assert pod.cd(folder).read_range(filename, 10, 5) == bytes(range(10, 15))
+    assert calls == [(filename, 10, 5)]
+    assert not local.isfile(str(folder / filename))
+    # Cached ranges are bounded by their total size
+    assert pod.ranges.nbytes == 5
+    assert pod.ranges.max_bytes == CachePOD.ranges_bytes
+
+    # Local segments are read from the local pod
+    sub.read(filename)
+    assert sub.read_range(filename, 20, 5) == bytes(range(20, 25))
+    assert len(calls) == 1
+
+
+def test_cache_pod_max_size():
+    local, remote = MemPOD("."), MemPOD(".")
+    pod = CachePOD(local, remote, max_size=25)
+    digests = [hexdigest(bytes([i])) for i in range(4)]
+    for i, dig in enumerate(digests):
+        folder, filename = hashed_path(dig)
+        pod.cd(folder).write(filename, bytes([i]) * 10)
+    # Other files are not cached
+    pod.write("collection/rev", b"revision")
+    assert remote.read("collection/rev") == b"revision"
+    assert not local.isfile("collection/rev")
+
+    # Only the last two segments are kept in the local pod
+    paths = [str(PurePosixPath(*hashed_path(dig))) for dig in digests]
+    assert [local.isfile(p) for p in paths] == [False, False, True, True]
+
+    # Reading an evicted segment brings it back
+    assert pod.read(paths[0]) == bytes([0]) * 10
+    assert [local.isfile(p) for p in paths] == [True, False, False, True]
+    assert pod.index.size == 20
+
+    # Index is persisted in the local pod
+    pod.index.flush()
+    pod = CachePOD(local, remote, max_size=25)
+    assert list(pod.index.entries) == [paths[3], paths[0]]
+
+
+def test_cache_index_load(tmp_path, monkeypatch):
+    local, remote = FilePOD(tmp_path), MemPOD(".")
+    pod = CachePOD(local, remote, max_size=100)
+    paths = []
+    for i in range(3):
+        folder, filename = hashed_path(hexdigest(bytes([i])))
+        pod.cd(folder).write(filename, bytes([i]) * 10)
+        paths.append(str(folder / filename))
+    # Index is not flushed on each change
+    assert local.read(".cache-index") == b"[]"
+    pod.flush()
+
+    # Persisted index is trusted, local pod is not scanned
+    def walk(*a, **kw):
+        raise AssertionError("unexpected walk")
+
+    monkeypatch.setattr(FilePOD, "walk", walk)
+    pod = CachePOD(local, remote, max_size=100)
+    assert list(pod.index.entries) == paths
+    assert pod.index.size == 30
+    monkeypatch.undo()
+
+    # Without index, cached segments are removed
+    local.rm(".cache-index")
+    pod = CachePOD(local, remote, max_size=100)
+    assert list(pod.index.entries) == []
+    assert pod.index.size == 0
+    assert not any(local.isfile(p) for p in paths)
+    # Index file is replaced without leftovers
+    assert [n for n in local.ls() if n.startswith(".")] == [".cache-index"]
+    assert pod.read(paths[0]) == bytes([0]) * 10
+
+
+def test_replace(pod):
+    pod.write("ham", b"ham")
+    assert pod.replace("ham", b"spam") == 4
+    assert pod.read("ham") == b"spam"
+    assert pod.replace("spam/eggs", b"eggs") == 4
+    assert pod.read("spam/eggs") == b"eggs"
+
+
+def test_cache_pod_ttl():
+    local, remote = MemPOD("."), MemPOD(".")
+    pod = CachePOD(local, remote, ttl=60)
+    pod.write("ham/a", b"")
+    assert pod.ls("ham") == ["a"]
+    # Listing is cached
+    remote.write("ham/b", b"")
+    assert pod.ls("ham") == ["a"]
+    assert pod.cd("ham").ls() == ["a"]
+    # Writes and deletions through pod invalidate listings
+    pod.cd("ham").write("c", b"")
+    assert pod.ls("ham") == ["a", "b", "c"]
+    assert pod.ls("ham", start_after="a") == ["b", "c"]
+    pod.rm("ham/a")
+    assert pod.ls("ham") == ["b", "c"]
+    assert pod.ls("ham", start_after="a") == ["b", "c"]
+    pod.rm("ham", recursive=True)
+    assert pod.ls(missing_ok=True) == []
+
+    # Existence of segments is checked locally
+    folder, filename = hashed_path(hexdigest(b"spam"))
+    pod.cd(folder).write(filename, b"spam")
+    remote.cd(folder).rm(filename)
+    assert pod.cd(folder).isfile(filename)
+    assert not pod.isfile("ham/a")
+
+
+def test_listings():
+    listings = Listings(ttl=10, size=3)
+    listings.set("ham", None, ["a"])
+    listings.set("ham", "a", ["b"])
+    listings.set("ham/spam", None, ["c"])
+    assert listings.get("ham") == ["a"]
+    # Least recently used entry is evicted
+    listings.set("eggs", None, ["d"])
+    assert len(listings) == 3
+    assert listings.get("ham", "a") is None
+    assert listings.get("ham") == ["a"]
+
+    # Expired entries are dropped on insertion
+    listings.set("foo", None, [], now=time() + 20)
+    assert len(listings) == 1
+    assert listings.get("ham") is None
+
+    # Invalidation drops ancestors, and descendants if recursive
+    for path in ("ham", "ham/spam", "ham/spam/eggs"):
+        listings.set(path, None, [])
+    listings.invalidate("ham/spam")
+    assert listings.get("ham/spam/eggs") == []
+    assert listings.get("ham") is None
+    listings.invalidate("ham", recursive=True)
+    assert listings.get("ham/spam/eggs") is None
+    assert set(listings.by_path) == set()
+
+
+def test_cache_pod_write_behind():
+    class FlakyPOD(MemPOD):
+        failures = 1
+
+        def write(self, relpath, data, mode="wb"):
+            if FlakyPOD.failures:
+                FlakyPOD.failures -= 1
+                raise ConnectionError("Boom")
+            return super().write(relpath, data, mode=mode)
+
+    local, remote = MemPOD("."), FlakyPOD(".")
+    pod = CachePOD(local, remote, write_behind=True)
+    pod.uploader.backoff = 0
+    _, filename = hashed_path(hexdigest(b"spam"))
+    assert pod.write(filename, b"spam") == 4
+    assert local.read(filename) == b"spam"
+    # Second write is skipped
+    assert pod.write(filename, b"spam") is None
+
+    # Other files are written after pending uploads (despite the
+    # first failure)
+    pod.write("ham", b"ham")
+    assert remote.read(filename) == b"spam"
+    assert remote.read("ham") == b"ham"
+
+    # Errors are raised on flush
+    FlakyPOD.failures = pod.uploader.retries + 1
+    _, filename = hashed_path(hexdigest(b"foo"))
+    pod.write(filename, b"foo")
+    with pytest.raises(ConnectionError):
+        pod.flush()
+
+    # Failed uploads are kept and retried, other files are not written
+    # before they succeed
+    FlakyPOD.failures = 1000
+    assert pod.write(filename, b"foo") is None
+    with pytest.raises(ConnectionError):
+        pod.write("eggs", b"eggs")
+    assert not remote.isfile("eggs")
+    FlakyPOD.failures = 0
+    pod.write("eggs", b"eggs")
+    assert remote.read(filename) == b"foo"
+    assert remote.read("eggs") == b"eggs"
+    pod.flush()
+
+
+def test_cache_pod_write_behind_local_leftover(tmp_path):
+    class LogPOD(MemPOD):
+        def write(self, relpath, data, mode="wb"):
+            written.append(relpath)
+            return super().write(relpath, data, mode=mode)
+
+    # Segment left in the local pod by a process that failed to
+    # upload it
+    written = []
+    local, remote = FilePOD(tmp_path), LogPOD(".")
+    _, filename = hashed_path(hexdigest(b"spam"))
+    local.write(filename, b"spam")
+
+    pod = CachePOD(local, remote, write_behind=True)
+    assert pod.write(filename, b"spam") is None
+    pod.write("rev", b"rev")
+    # Segment is uploaded before the revision is published
+    assert written == [filename, "rev"]
+    assert remote.read(filename) == b"spam"
+
+
+def test_write_many(pod):
+    items = [(f"ham/{i}", bytes([i]) * i) for i in range(1, 5)]
+    assert pod.write_many(items) == [i for i in range(1, 5)]
+    assert pod.write_many(items[:2]) == [None, None]
+    assert pod.read_many([k for k, _ in items]) == [d for _, d in items]
+    assert pod.write_many([]) == []
@@ -3,7 +3,7 @@ from itertools import product
 import pytest
 
 from lakota import Repo, Schema
-from lakota.pod import MemPOD
+from lakota.pod import CachePOD, MemPOD
 from lakota.utils import chunky
 
 LABELS = "zero one two three four five six seven eight nine".split()
@@ -177,3 +177,16 @@ def test_refresh():
     # refresh slove ths
     repo.refresh()
     assert repo.ls() == []
+
+
+def test_write_behind():
+    remote = MemPOD(".")
+    repo = Repo(pod=CachePOD(MemPOD("."), remote, write_behind=True))
+    clct = repo.create_collection(SCHEMA, "collection")
+    values = list(range(10_000))
+    clct.series("a").write({"timestamp": values, "value": values})
+
+    # Revisions are published after segments, so the remote is usable
+    # as soon as the write returns
+    frm = (Repo(pod=remote) / "collection" / "a").frame()
+    assert list(frm["timestamp"]) == values
@@ -1,3 +1,4 @@
+import pytest
 from numpy import asarray
 from pandas import DataFrame, date_range
 
@@ -22,6 +23,20 @@ def test_simple_codec():
     assert all(arr == arr2)
 
 
+def test_raw_codec():
+    arr = asarray(range(-100, 100), dtype="f8")
+    codec = Codec("f8", "raw")
+    data = codec.encode(arr)
+    assert data == arr.tobytes()
+    arr2 = codec.decode(memoryview(data))
+    assert all(arr == arr2)
+    # Decoding does not copy data
+    assert arr2.base is not None
+
+    with pytest.raises(ValueError):
+        Codec("U", "raw")
+
+
 def test_vlen_codecs():
     for codecs in ("", "vlen-utf8", "vlen-utf8 gzip"):
         schema = Schema(f"val str*  |{codecs}")
@@ -76,3 +91,28 @@ def test_equality():
     str str
     """
     assert Schema(definition) == Schema(definition)
+
+
+@pytest.mark.parametrize("dt", ["i8", "f8", "M8[s]", "U"])
+def test_blocks(dt):
+    arr = asarray(range(1_000)).astype(dt)
+    codec = Codec(dt)
+    data = codec.encode_blocks(arr, 100, bounds=True)
+    assert all(codec.decode_rows(data, blocks=True) == arr)
+
+    header, _ = Codec.read_header(data)
+    assert header["rows"] == list(range(0, 1_001, 100))
+    mins = codec.decode(header["min"])
+    assert all(mins == [min(arr[i : i + 100]) for i in range(0, 1_000, 100)])
+    with pytest.raises(ValueError):
+        Codec.read_header(codec.encode(arr))
+
+    for start, stop in (
+        (0, 10),
+        (95, 105),
+        (150, 450),
+        (990, 1_000),
+        (5, 5),
+        (995, 2_000),
+    ):
+        assert all(codec.decode_rows(data, start, stop, True) == arr[start:stop])
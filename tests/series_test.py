@@ -2,10 +2,15 @@ from time import sleep
 
 import pytest
 from numpy import asarray
+from numpy.random import random
 from pandas import DataFrame
 
 from lakota import Frame, Repo, Schema
+from lakota.commit import Segment
+from lakota.pod import MemPOD
+from lakota.schema import Codec
 from lakota.schema import ALIASES
+from lakota.utils import settings
 
 schema = Schema(["timestamp int *", "value float"])
 orig_frm = {
@@ -31,6 +36,41 @@ def series(request, repo):
     return series
 
 
+@pytest.fixture
+def segmented(series):
+    # Add ten segments of ten rows to series
+    for i in range(10):
+        start = 1589456000 + i * 10
+        series.write({"timestamp": range(start, start + 10), "value": [i] * 10})
+    return series
+
+
+@pytest.fixture
+def data_reads(monkeypatch):
+    # Record (segment id, column) of each payload access
+    reads = []
+    _data = Segment._data
+    monkeypatch.setattr(
+        Segment,
+        "_data",
+        lambda sgm, name: reads.append((id(sgm), name)) or _data(sgm, name),
+    )
+    return reads
+
+
+@pytest.fixture
+def block_series(repo, monkeypatch):
+    # Series of 100k rows written in blocks of 1k rows
+    series = repo.create_collection(schema, "blocks") / "_"
+    frm = {
+        "timestamp": asarray(range(100_000)),
+        "value": random(100_000),
+    }
+    monkeypatch.setattr(settings, "block_size", 1_000)
+    series.write(frm)
+    return series, frm
+
+
 def test_read_series(series):
     # Read those back
     frm_copy = series.frame()
@@ -169,6 +209,75 @@ def test_column_types(repo):
             assert all(frm[str(dt)] == df[str(dt)])
 
 
+def test_raw_codec(tmp_path, monkeypatch):
+    repo = Repo(f"file:///{tmp_path}")
+    schema = Schema(["timestamp int * |raw", "value float |raw"])
+    series = repo.create_collection(schema, "raw") / "_"
+    frm = {
+        "timestamp": asarray(range(10_000)),
+        "value": asarray(range(10_000), dtype="f8") / 2,
+    }
+    series.write(frm)
+
+    monkeypatch.setattr(settings, "mmap_min_size", 1)
+    res = series.frame()
+    assert all(res["timestamp"] == frm["timestamp"])
+    assert all(res["value"] == frm["value"])
+    res = series[5_000:5_010].frame()
+    assert list(res["timestamp"]) == list(range(5_000, 5_010))
+
+
+def test_block_layout(repo, monkeypatch):
+    series = repo.create_collection(schema, "blocks") / "_"
+    frm = {
+        "timestamp": asarray(range(10_000)),
+        "value": asarray(range(10_000), dtype="f8") / 2,
+    }
+    monkeypatch.setattr(settings, "block_size", 1_000)
+    series.write(frm)
+    monkeypatch.setattr(settings, "block_size", 0)
+
+    decoded = []
+    decode = Codec.decode
+    monkeypatch.setattr(
+        Codec, "decode", lambda codec, arr: decoded.append(arr) or decode(codec, arr)
+    )
+    res = series[2_500:4_200].frame()
+    assert list(res["timestamp"]) == list(range(2_500, 4_200))
+    assert list(res["value"]) == [i / 2 for i in range(2_500, 4_200)]
+    # Only blocks 2, 3 and 4 of both columns are decoded
+    blocks = [arr for arr in decoded if isinstance(arr, memoryview)]
+    assert len(blocks) == 3 * 2
+
+    res = series.frame()
+    assert all(res["timestamp"] == frm["timestamp"])
+    assert all(res["value"] == frm["value"])
+
+
+def test_block_ranged_reads(block_series, monkeypatch):
+    series, frm = block_series
+    # Layout is known from the commit, not from the settings
+    monkeypatch.setattr(settings, "block_size", 0)
+    # Pretend the memory pod is remote
+    monkeypatch.setattr(MemPOD, "ranged", True)
+    fetched = []
+    read_range = MemPOD.read_range
+    monkeypatch.setattr(
+        MemPOD,
+        "read_range",
+        lambda *a: fetched.append(len(read_range(*a))) or read_range(*a),
+    )
+    monkeypatch.setattr(MemPOD, "mmap", None)  # No full reads
+
+    res = series[50_500:51_200].frame()
+    assert list(res["timestamp"]) == list(range(50_500, 51_200))
+    assert all(res["value"] == frm["value"][50_500:51_200])
+    # The (compressed) index is small enough to be read at once,
+    # for values the head of the file then the two blocks needed
+    assert len(fetched) == 3
+    assert sum(fetched) < frm["value"].nbytes / 5
+
+
 def test_kv_series(repo):
     schema = Schema(["timestamp timestamp*", "category str*", "value int"], kind="kv")
     clct = repo.create_collection(schema, "-")
@@ -281,6 +390,80 @@ def test_paginate(series, extra_commit):
     assert res == []
 
 
+def test_paginate_cursor(segmented, data_reads, monkeypatch):
+    series, reads = segmented, data_reads
+    released = []
+    release = Segment.release
+    monkeypatch.setattr(
+        Segment, "release", lambda sgm: released.append(sgm) or release(sgm)
+    )
+
+    frames = list(series.paginate(7, offset=5))
+    assert [len(f) for f in frames] == [7] * 14
+    values = [v for f in frames for v in f["value"]]
+    assert values == [v for v in range(10) for _ in range(10)][2:]
+    # Each column of each segment is decoded once, and released. The
+    # skipped one is not read at all (its length is in the commit)
+    assert len(reads) == len(set(reads)) == 10 * 2
+    assert all(sgm._frm is None for sgm in released)
+    assert len(released) == 10
+
+
+def test_offset_pushdown(segmented, data_reads):
+    series, reads = segmented, data_reads
+    # Lengths come from the commit
+    assert len(series) == len(series.frame())
+    reads.clear()
+    assert len(series) == 103
+    assert reads == []
+
+    # Only the segment containing the rows is read
+    res = series.frame(offset=58, limit=5)
+    assert list(res["value"]) == [5] * 5
+    assert len(reads) == 2
+    reads.clear()
+    frames = list(series.paginate(3, offset=98))
+    assert [list(f["value"]) for f in frames] == [[9, 9, 9], [9, 9]]
+    assert len(reads) == 2
+
+    # Segments cut by start or stop are decoded
+    reads.clear()
+    qr = series.query(start=1589456005, stop=1589456015)
+    assert len(qr) == 10
+    assert len(reads) == 2
+    res = qr.frame(offset=6, limit=2)
+    assert list(res["timestamp"]) == [1589456011, 1589456012]
+
+
+def test_narrowed_write(repo):
+    series = repo.create_collection(schema, "narrow") / "_"
+    frm = {"timestamp": range(10), "value": range(10)}
+    series.write(frm, start=3, stop=6)
+    assert len(series) == 4
+    assert list(series.frame()["timestamp"]) == [3, 4, 5, 6]
+    assert list(series.frame(offset=2)["timestamp"]) == [5, 6]
+    assert list(series.frame(offset=1, limit=10)["timestamp"]) == [4, 5, 6]
+
+
+def test_offset_pushdown_blocks(block_series, monkeypatch):
+    series, frm = block_series
+    # Load the commit
+    assert len(series) == 100_000
+
+    decoded = []
+    decode = Codec.decode
+    monkeypatch.setattr(Codec, "decode", lambda *a: decoded.append(1) or decode(*a))
+    res = series.frame(offset=70_500, limit=10)
+    assert all(res["value"] == frm["value"][70_500:70_510])
+    # Only one block per column is decoded, the index is not read
+    assert len(decoded) == 2
+
+    # Read past the end
+    assert len(series.frame(limit=200_000)) == 100_000
+    res = series.frame(offset=99_995, limit=10)
+    assert all(res["value"] == frm["value"][99_995:])
+
+
 # def test_partition(repo):
 #     schema = Schema(["timestamp timestamp*", "value float"])
 #     clct = repo.create_collection(schema, "timeseries")
@@ -443,3 +626,48 @@ def test_bisect_range():
     # assert all(res["start"] == expect)
     # expect = asarray(["2020-01-03", "2020-01-07", "2020-01-10", "2020-01-20"], "M8")
     # assert all(res["stop"] == expect)
+
+
+def test_mask(repo):
+    series = repo.create_collection(schema, "mask") / "_"
+    for i in range(5):
+        series.write({"timestamp": [i * 10, i * 10 + 1], "value": [i, i + 0.5]})
+
+    qr = series @ {}
+    assert len(qr.segments()) == 5
+    qr = qr @ {"mask": "(> self.value 3.5)"}
+    # Only the last segment can match
+    assert len(qr.segments()) == 1
+    frm = qr.frame()
+    assert list(frm["value"]) == [4, 4.5]
+    assert len(qr) == 2
+
+    # Limit and offset apply on filtered rows
+    qr = series @ {"mask": "(>= self.value 1)", "offset": 1, "limit": 2}
+    assert list(qr.frame()["value"]) == [1.5, 2]
+    assert list(qr.frame(select=["value"])) == ["value"]
+
+    # Masked pagination skip empty pages
+    qr = series @ {"mask": "(or (< self.value 1) (> self.value 4))"}
+    pages = [list(frm["value"]) for frm in qr.paginate(2)]
+    assert pages == [[0, 0.5], [4.5]]
+
+    # Paginate and frame agree on limit and offset
+    for offset, limit in ((0, 3), (1, 2), (4, None), (5, 1), (0, 0)):
+        qr = series @ {"mask": "(> self.value 2)", "offset": offset, "limit": limit}
+        expected = list(qr.frame()["value"])
+        for step in (1, 2, 3, 10):
+            res = [v for frm in qr.paginate(step) for v in frm["value"]]
+            assert res == expected
+
+
+def test_arrow(series):
+    pytest.importorskip("pyarrow")
+    tbl = series.arrow()
+    assert tbl.column("value").to_pylist() == [3.3, 4.4, 5.5]
+    tbl = (series @ {"select": ["value"]}).arrow()
+    assert tbl.column_names == ["value"]
+
+    batches = list(series.record_batches(step=2))
+    assert [b.num_rows for b in batches] == [2, 1]
+    assert list(Frame.from_arrow(schema, batches[1])["value"]) == [5.5]
@@ -0,0 +1,313 @@
+import asyncio
+import socket
+import time
+from subprocess import DEVNULL, Popen
+
+import msgpack
+import pytest
+from numcodecs import registry
+
+from lakota import Frame, Repo, Schema
+from lakota.asgi import App, chunk_size
+from lakota.http_pod import HttpPOD
+from lakota.pod import FilePOD
+from lakota.http_repo import HttpQuery, HttpRepo
+
+
+def call(app, path, query="", body=b"", headers=None):
+    """
+    Run the asgi app on one request, returns status, headers and
+    body chunks
+    """
+    messages = []
+    headers = [(k.encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {
+        "type": "http",
+        "method": "POST" if body else "GET",
+        "path": path,
+        "query_string": query.encode(),
+        "headers": headers,
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start, *chunks = messages
+    return start["status"], dict(start["headers"]), [c["body"] for c in chunks]
+
+
+schema = Schema(["timestamp int*", "value float"])
+
+
+@pytest.fixture
+def app(tmp_path):
+    return App(Repo(f"file:///{tmp_path}"), prefix="/prefix")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def http_repo(tmp_path):
+    port = free_port()
+    web_uri = f"http://127.0.0.1:{port}/"
+    proc = Popen(
+        ["lakota", "-r", f"file:///{tmp_path}", "serve", web_uri],
+        stderr=DEVNULL,
+        stdout=DEVNULL,
+    )
+    with proc:
+        # Wait for the server to accept connections
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline or proc.poll() is not None:
+                    raise
+                time.sleep(0.05)
+        yield HttpRepo(web_uri)
+        proc.terminate()
+
+
+def test_read_write(app):
+    data = bytes(range(256)) * 1000
+    status, _, body = call(app, "/prefix/write", "path=ham/spam", body=data)
+    assert status == 200
+    assert body == [str(len(data)).encode()]
+
+    status, headers, body = call(app, "/prefix/read", "path=ham/spam")
+    assert status == 200
+    assert headers[b"content-length"] == str(len(data)).encode()
+    # Content is streamed
+    assert len(body) == len(data) // chunk_size + 1
+    assert b"".join(body) == data
+
+    status, _, body = call(app, "/prefix/ls", "path=ham")
+    assert body == [b"spam"]
+
+    status, _, _ = call(app, "/prefix/read", "path=ham/foo")
+    assert status == 404
+    status, _, _ = call(app, "/other/read", "path=ham/spam")
+    assert status == 404
+
+
+def test_range(app):
+    data = bytes(range(100))
+    call(app, "/prefix/write", "path=ham", body=data)
+    for rng, expected in (
+        ("bytes=10-19", data[10:20]),
+        ("bytes=90-", data[90:]),
+        ("bytes=-5", data[-5:]),
+        ("bytes=95-200", data[95:]),
+    ):
+        status, headers, body = call(
+            app, "/prefix/read", "path=ham", headers={"range": rng}
+        )
+        assert status == 206
+        assert b"".join(body) == expected
+        assert headers[b"content-range"].endswith(b"/100")
+
+    status, _, _ = call(
+        app, "/prefix/read", "path=ham", headers={"range": "bytes=200-"}
+    )
+    assert status == 416
+
+
+def test_stream_segment(app, monkeypatch):
+    data = bytes(range(256)) * 1000
+    segment = "ab/ab/" + "ab" * 18
+    call(app, "/prefix/write", f"path={segment}", body=data)
+
+    # Segments are never read at once
+    reads = []
+    read_range = FilePOD.read_range
+    monkeypatch.setattr(
+        FilePOD,
+        "read_range",
+        lambda pod, *a: reads.append(a[1:]) or read_range(pod, *a),
+    )
+    monkeypatch.setattr(FilePOD, "read", None)
+    monkeypatch.setattr(FilePOD, "mmap", None)
+    status, headers, body = call(app, "/prefix/read", f"path={segment}")
+    assert status == 200
+    assert headers[b"content-length"] == str(len(data)).encode()
+    assert b"".join(body) == data
+    assert len(reads) == len(data) // chunk_size + 1
+    assert all(length <= chunk_size for _, length in reads)
+
+    reads.clear()
+    status, _, body = call(
+        app, "/prefix/read", f"path={segment}", headers={"range": "bytes=-10"}
+    )
+    assert status == 206
+    assert b"".join(body) == data[-10:]
+    assert reads == [(len(data) - 10, 10)]
+
+
+def test_many(app):
+    items = [("a", b"ham"), ("b/c", b"spam")]
+    _, _, body = call(app, "/prefix/write_many", body=msgpack.packb(items))
+    assert msgpack.unpackb(b"".join(body)) == [3, 4]
+    _, _, body = call(app, "/prefix/read_many", body=msgpack.packb(["b/c", "a"]))
+    assert msgpack.unpackb(b"".join(body)) == [b"spam", b"ham"]
+
+
+def test_metrics(app):
+    call(app, "/prefix/ls")
+    call(app, "/prefix/ls")
+    # Unmatched paths share the same label
+    call(app, "/prefix/foo")
+    call(app, "/prefix/bar")
+    call(app, "/other/ls")
+    _, _, body = call(app, "/prefix/metrics")
+    text = b"".join(body).decode()
+    assert 'lakota_request_duration_seconds_count{action="ls"} 2' in text
+    assert 'lakota_request_duration_seconds_bucket{action="ls",le="+Inf"} 2' in text
+    assert 'lakota_request_duration_seconds_count{action="unknown"} 3' in text
+    assert "foo" not in text
+
+
+def test_query(app):
+    series = app.repo.create_collection(schema, "temperature") / "brussels"
+    series.write({"timestamp": [1, 2, 3, 4], "value": [1, 2, 3, 4]})
+    params = {
+        "collection": "temperature",
+        "series": "brussels",
+        "start": ["2"],
+        "mask": "(< self.value 4)",
+        "reduce": {"total": "(sum self.value)"},
+    }
+    status, _, body = call(app, "/prefix/query", body=msgpack.packb(params))
+    assert status == 200
+    frm = Frame.decode(b"".join(body))
+    assert list(frm) == ["total"]
+    assert list(frm["total"]) == [5]
+
+    status, _, body = call(app, "/prefix/len", body=msgpack.packb(params))
+    assert status == 200
+    assert msgpack.unpackb(b"".join(body)) == 1
+    del params["reduce"]
+    _, _, body = call(app, "/prefix/len", body=msgpack.packb(params))
+    assert msgpack.unpackb(b"".join(body)) == 2
+
+    params["collection"] = "missing"
+    status, _, _ = call(app, "/prefix/query", body=msgpack.packb(params))
+    assert status == 404
+
+
+def test_http_repo(http_repo, monkeypatch):
+    series = http_repo.create_collection(schema, "temperature") / "brussels"
+    series.write({"timestamp": [1, 2, 3, 4], "value": [1, 2, 3, 4]})
+    assert isinstance(series.query(), HttpQuery)
+
+    frm = series[2:3].frame(closed="b")
+    assert list(frm["timestamp"]) == [2, 3]
+    assert list(frm["value"]) == [2, 3]
+    frm = series.frame(mask="(> self.value 2)", select="value")
+    assert list(frm) == ["value"]
+    assert list(frm["value"]) == [3, 4]
+    frm = series.frame(
+        reduce={"parity": "(% self.timestamp 2)", "value": "(max self.value)"}
+    )
+    assert list(frm["parity"]) == [0, 1]
+    assert list(frm["value"]) == [4, 3]
+
+    assert len(series) == 4
+    assert len(series.query(mask="(> self.value 2)")) == 2
+    # Only the number of rows is transferred
+    actions = []
+    query = HttpPOD.query
+    monkeypatch.setattr(
+        HttpPOD,
+        "query",
+        lambda pod, params, action="query": actions.append(action)
+        or query(pod, params, action),
+    )
+    assert len(series[1:3]) == 2
+    assert actions == ["len"]
+    monkeypatch.undo()
+    pages = list(series.paginate(step=3))
+    assert [len(p) for p in pages] == [3, 1]
+
+    # Mask is applied before offset and limit, like with local queries
+    local = Repo().create_collection(schema, "temperature") / "brussels"
+    local.write({"timestamp": [1, 2, 3, 4], "value": [1, 2, 3, 4]})
+    params = {"mask": "(> self.value 1)", "offset": 1, "limit": 2}
+    for qr in (series.query(**params), local.query(**params)):
+        assert list(qr.frame()["value"]) == [3, 4]
+        assert [v for p in qr.paginate(step=1) for v in p["value"]] == [3, 4]
+
+
+def test_etag(app):
+    digest = "ab" * 20
+    segment = f"ab/ab/{digest[4:]}"
+    call(app, "/prefix/write", f"path={segment}", body=b"ham")
+    call(app, "/prefix/write", "path=spam", body=b"spam")
+
+    status, headers, _ = call(app, "/prefix/read", f"path={segment}")
+    assert headers[b"etag"] == f'"{digest}"'.encode()
+    assert b"immutable" in headers[b"cache-control"]
+    etag = headers[b"etag"].decode()
+    status, _, body = call(
+        app, "/prefix/read", f"path={segment}", headers={"if-none-match": etag}
+    )
+    assert status == 304
+    assert b"".join(body) == b""
+
+    status, headers, _ = call(app, "/prefix/read", "path=spam")
+    assert headers[b"cache-control"] == b"no-cache"
+    etag = headers[b"etag"].decode()
+    status, _, _ = call(
+        app, "/prefix/read", "path=spam", headers={"if-none-match": etag}
+    )
+    assert status == 304
+    status, _, _ = call(
+        app, "/prefix/read", "path=spam", headers={"if-none-match": '"x"'}
+    )
+    assert status == 200
+
+
+def test_compressed_ls(app):
+    zstd = registry.codec_registry["zstd"]()
+    for name in ("ham", "spam"):
+        call(app, "/prefix/write", f"path={name}", body=b"")
+    _, headers, body = call(app, "/prefix/ls", headers={"accept-encoding": "zstd"})
+    assert headers[b"content-encoding"] == b"zstd"
+    assert sorted(zstd.decode(b"".join(body)).split()) == [b"ham", b"spam"]
+
+
+def test_http_pod_cache(http_repo):
+    pod = http_repo.pod
+    calls = []
+    get = pod.session.get
+    pod.session.get = lambda *a, **kw: calls.append(a) or get(*a, **kw)
+
+    segment = f"ab/ab/{'ab' * 18}"
+    pod.write(segment, b"ham")
+    assert pod.read(segment) == b"ham"
+    assert pod.read(segment) == b"ham"
+    assert pod.cd("ab").read(f"ab/{'ab' * 18}") == b"ham"
+    assert len(calls) == 1
+    # Cache is bounded by the size of payloads
+    assert pod.cache.max_bytes == HttpPOD.cache_bytes
+    assert pod.cache.nbytes == 3
+
+    pod.write("spam", b"spam")
+    assert pod.read("spam") == b"spam"
+    assert pod.read("spam") == b"spam"  # revalidated
+    assert len(calls) == 3
+    pod.rm("spam")
+    pod.write("spam", b"eggs")
+    assert pod.read("spam") == b"eggs"
+
+    assert sorted(pod.ls()) == ["ab", "spam"]
+    assert sorted(pod.walk()) == [segment, "spam"]
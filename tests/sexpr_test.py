@@ -1,5 +1,5 @@
 import pytest
-from numpy import asarray
+from numpy import asarray, datetime64
 
 from lakota import Frame, Schema
 from lakota.sexpr import AST, KWargs
@@ -135,3 +135,33 @@ def test_alias():
     frm = Frame(schema, values)
     frm = frm.reduce("(as self.timestamp 'ts')")
     assert all(frm["ts"] == values["timestamp"])
+
+
+def test_may_match():
+    stats = {
+        "value": (10, 20, 0),
+        "ts": (datetime64("2020-01-01"), datetime64("2020-02-01"), 0),
+    }
+    cases = {
+        "(> self.value 15)": True,
+        "(> self.value 20)": False,
+        "(>= self.value 20)": True,
+        "(< self.value 10)": False,
+        "(< 25 self.value)": False,
+        "(= self.value 5)": False,
+        "(!= self.value 10)": True,
+        "(and (> self.value 15) (< self.value 5))": False,
+        "(or (> self.value 25) (< self.value 12))": True,
+        "(> self.ts '2020-03-01')": False,
+        "(> self.ts '2020-01-15')": True,
+        # Unknown column, unsupported expressions and invalid
+        # comparisons may match
+        "(> self.other 100)": True,
+        "(> (* self.value 2) 100)": True,
+        "(> self.value 'ham')": True,
+    }
+    for expr, expected in cases.items():
+        assert AST.parse(expr).may_match(stats) == expected, expr
+
+    assert AST.parse("(!= self.value 10)").may_match({"value": (10, 10, 0)}) is False
+    assert AST.parse("(!= self.value 10)").may_match({"value": (10, 10, 1)}) is True
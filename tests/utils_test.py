@@ -3,7 +3,8 @@ from itertools import chain
 
 import pytest
 
-from lakota.utils import Closed, Pool, chunky, drange, strpt
+from lakota.pod import POD
+from lakota.utils import LRU, Closed, Pool, chunky, drange, settings, strpt
 
 
 def my_fun(i, flaky=False):
@@ -27,6 +28,28 @@ def test_pool(threaded):
                 pool.submit(my_fun, i, flaky=True)
 
 
+def nested(depth):
+    if depth == 0:
+        return 0
+    with Pool() as pool:
+        for _ in range(Pool.default_workers + 1):
+            pool.submit(nested, depth - 1)
+    return sum(pool.results) + 1
+
+
+def test_nested_pool(threaded):
+    # Would deadlock if nested submissions were run on the same executor
+    assert nested(3) == 1 + 5 * (1 + 5)
+
+
+def test_pod_workers(threaded, monkeypatch):
+    pod = POD.from_uri("memory://")
+    assert Pool(pod).inline
+    monkeypatch.setattr(settings, "workers", {"memory": 2})
+    assert pod.max_workers == 2
+    assert Pool(pod).inline == (not threaded)
+
+
 def test_chunk():
     for size in (1, 4, 13, 100):
         expected = list(range(size))
@@ -106,3 +129,37 @@ def test_closed():
     assert both.set_right(right) == both
     assert both.set_right(both) == both
     assert both.set_right(none) == left
+
+
+def test_lru_bytes():
+    lru = LRU(10, max_bytes=10)
+    lru.set("a", b"1234")
+    lru.set("b", b"1234")
+    assert lru.nbytes == 8
+    # Replacing a value updates the total
+    lru.set("b", b"12")
+    assert lru.nbytes == 6
+    # Least recently used values are evicted to stay under max_bytes
+    lru.get("a")
+    lru.set("c", b"123456")
+    assert "b" not in lru
+    assert lru.nbytes == 10
+    # Values larger than max_bytes are not kept
+    lru.set("d", b"x" * 11)
+    assert len(lru) == 0
+    assert lru.nbytes == 0
+    lru.set("e", b"1")
+    assert lru.pop("e") == b"1"
+    assert lru.nbytes == 0
+
+
+def test_lru_resize():
+    lru = LRU(10)
+    for key in "abcd":
+        lru.set(key, b"123")
+    lru.resize(3)
+    assert [k for k in "abcd" if k in lru] == ["b", "c", "d"]
+    # Weights are computed when max_bytes is enabled
+    lru.resize(3, max_bytes=7)
+    assert [k for k in "abcd" if k in lru] == ["c", "d"]
+    assert lru.nbytes == 6